@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# asyncio driver for the Geoelectric Prototype
+# PrototypeInstrument Code: Geothings IGF-02 Geoelectric
+#
+# Same protocol as gelec, but the port is non-blocking and
+# serviced by the event loop: several instruments and the UI
+# may share one loop, timeouts and cancellation are immediate.
+#---------------------------------------------------------
+
+import asyncio
+import serial
+import gelec
+from gelec import Reading, probestr
+
+class Instrument:
+    def __init__(_, sdev, speed=9600, timeout=1.0):
+        _.sdev=sdev
+        _.speed=speed
+        _.timeout=timeout
+        _.nprobe=gelec.NPROBE
+        _.ser=None
+        _.relays=None
+        _.tau=None      # fitted discharge time constant
+        _.buf=bytearray()
+        _.rxev=asyncio.Event()
+        _.lock=asyncio.Lock()
+
+    # ---- transport ----
+
+    def _readable(_):
+        try:
+            data=_.ser.read(_.ser.in_waiting or 1)
+        except serial.SerialException:
+            data=b''
+        if data:
+            _.buf.extend(data)
+            _.rxev.set()
+
+    async def open(_):
+        _.ser=serial.Serial(_.sdev, _.speed, timeout=0)
+        asyncio.get_running_loop().add_reader(_.ser.fileno(), _._readable)
+        await asyncio.sleep(2)  # board resets on open
+        _.buf.clear()
+        return _
+
+    def close(_):
+        if _.ser:
+            asyncio.get_running_loop().remove_reader(_.ser.fileno())
+            _.ser.close()
+            _.ser=None
+
+    async def __aenter__(_):
+        return await _.open()
+
+    async def __aexit__(_, *exc):
+        _.close()
+
+    async def _until(_, term):
+        while term not in _.buf:
+            _.rxev.clear()
+            await _.rxev.wait()
+        n=_.buf.index(term)+len(term)
+        s=bytes(_.buf[:n])
+        del _.buf[:n]
+        return s
+
+    async def _idle(_, quiet):
+        '''legacy framing: everything until the line is quiet for quiet seconds'''
+        while True:
+            _.rxev.clear()
+            try:
+                await asyncio.wait_for(_.rxev.wait(), quiet)
+            except asyncio.TimeoutError:
+                break
+        s=bytes(_.buf)
+        _.buf.clear()
+        return s
+
+    async def _reply(_, frame, timeout):
+        if frame is None:
+            s=await _._idle(timeout)
+        elif isinstance(frame,str):
+            s=await _._until(bytes(frame,'ascii'))
+        else:
+            s=b''
+            for i in range(frame):
+                s+=await _._until(b'\n')
+        return s.decode().replace('\r','')
+
+    async def _read(_, frame, timeout):
+        # an unframed reply ends on its own after timeout of silence
+        if frame is None:
+            return await _._reply(frame, timeout)
+        try:
+            return await asyncio.wait_for(_._reply(frame, timeout), timeout)
+        except asyncio.TimeoutError:
+            s=bytes(_.buf).decode().replace('\r','')
+            _.buf.clear()
+            return s
+
+    # ---- commands ----
+
+    async def send(_, scmd, timeout=None):
+        return (await _.sendbatch([scmd], timeout))[0]
+
+    async def sendbatch(_, cmds, timeout=None):
+        if timeout is None:
+            timeout=_.timeout
+        async with _.lock:
+            _.buf.clear()
+            rep=[]
+            for seg in gelec.segments(cmds):
+                _.ser.write(bytes(''.join([c+'\n' for c in seg]),'ascii'))
+                for c in seg:
+                    _.relays=gelec.track(_.relays, c)
+                    rep.append(await _._read(gelec.framing(c), timeout))
+            return rep
+
+    async def _switch(_, ss, force):
+        wt=gelec.breakwait(_.relays,ss)
+        brk,mk=gelec.transition(_.relays,ss,force)
+        if brk:
+            await _.send(brk)
+            await asyncio.sleep(gelec.RELAY_WAIT if brk=='q' else wt)
+        return mk
+
+    async def probe(_,pm,pp,vm,vp,force=False):
+        mk=await _._switch(probestr(pm,pp,vm,vp),force)
+        if mk:
+            await _.sendbatch(mk)
+
+    async def probe_off(_):
+        await _.send('q')
+
+    async def probe_inject(_,pm,pp,vm,vp,ival,force=False):
+        mk=await _._switch(probestr(pm,pp,vm,vp),force)
+        await _.sendbatch(mk+['v'+str(ival),'Z'])
+        await asyncio.sleep(gelec.INJ_WAIT)
+
+    async def release(_):
+        await _.sendbatch(['q','D'])
+
+    async def inject(_, stat=True):
+        await _.send('Z' if stat else 'D')
+
+    async def set_injection(_, ival):
+        await _.send('v'+str(ival))
+
+    async def set_measure_injection(_, pwm):
+        await _.send('v'+str(pwm))
+        await asyncio.sleep(gelec.INJ_WAIT)
+        r=await _.sendbatch(['A','J'])
+        return float(r[0].split()[0]),float(r[1].split()[0])
+
+    async def measure(_):
+        sm,vs=await _.sendbatch(['m','S'])
+        sm=sm.split()
+        return Reading(float(sm[0]),float(sm[1]),float(sm[2]),float(vs.split()[0]))
+
+    async def _value(_, cmd):
+        return float((await _.send(cmd)).split()[0])
+
+    async def measure_voltage(_):
+        return await _._value('V')
+
+    async def measure_current(_):
+        return await _._value('A')
+
+    async def measure_injection(_):
+        return await _._value('J')
+
+    async def measure_shunt(_):
+        return await _._value('S')
+
+    async def shift(_, n=1):
+        await _.sendbatch(['s 0 1']*n)
+
+    async def get_devinfo(_):
+        return await _.send('?')
+
+    async def discharge(_, minvolt, minpwm=0, timeout=30):
+        '''returns the final voltage, the fitted time constant is kept in tau'''
+        loop=asyncio.get_running_loop()
+        await _.sendbatch(['v'+str(minpwm),'D'])
+        t0=loop.time()
+        tp=t0
+        vlow=await _.measure_injection()
+        wait=gelec.DIS_SAMPLE
+
+        while vlow > minvolt:
+            dt=loop.time()-t0
+            if dt>timeout:
+                break
+
+            await asyncio.sleep(max(0.0,min(wait,timeout-dt)))
+            vp=vlow
+            vlow=await _.measure_injection()
+            t=loop.time()
+
+            tau,wait=gelec.discharge_fit(tp,vp,t,vlow,minvolt)
+            if tau is None:
+                wait=gelec.DIS_POLL
+            else:
+                _.tau=tau
+                wait=max(wait,gelec.SETTLE_POLL)
+            tp=t
+
+        return vlow
+
+async def abortable(coro, ev, poll=0.05):
+    '''
+    run coro until it finishes or the threading.Event ev is cleared
+    (the gectr.msrev abort path); returns None when aborted
+    '''
+    task=asyncio.ensure_future(coro)
+    while not task.done():
+        if not ev.is_set():
+            task.cancel()
+            break
+        await asyncio.wait([task], timeout=poll)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        return None
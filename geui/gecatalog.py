@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Survey catalog: SQLite index over the data files
+#
+# The data directory is scanned incrementally, only files that
+# are new or changed (mtime, size) are parsed. Surveys are then
+# selected on their metadata without opening the data files:
+#   python3 gecatalog.py scan [dir=.] [db=catalog.db]
+#   python3 gecatalog.py [dir=.] [db=catalog.db] [status=success]
+#           [name=line1] [confhash=..] [nprobe=16] [since=2020-10-01]
+#           [until=2020-11-01]
+#---------------------------------------------------------
+
+import os
+import sys
+import json
+import glob
+import sqlite3
+from math import isnan
+from datetime import datetime as dt
+import gejournal
+
+DBNAME='catalog.db'
+PATTERN='data-*.json'
+
+SCHEMA='''create table if not exists survey (
+    path text primary key,
+    mtime real,
+    size integer,
+    timestamp real,
+    status text,
+    name text,
+    confhash text,
+    nprobe integer,
+    npoint integer,
+    rmin real,
+    rmax real
+)'''
+
+FIELDS=('path','mtime','size','timestamp','status','name','confhash',
+        'nprobe','npoint','rmin','rmax')
+
+def connect(dbname=DBNAME):
+    db=sqlite3.connect(dbname)
+    db.execute(SCHEMA)
+    db.execute('create index if not exists survey_time on survey(timestamp)')
+    return db
+
+def timestamp(fnm, mtime):
+    '''acquisition time from data-<timestamp>.json, the file time otherwise'''
+    ts=os.path.basename(fnm).rsplit('.',1)[0].rsplit('-',1)[-1]
+    try:
+        return float(int(ts))
+    except ValueError:
+        return mtime
+
+def entry(fnm, st):
+    '''catalog row of a data file'''
+    with open(fnm) as fl:
+        jd=json.load(fl)
+
+    pc=jd.get('conf',{})
+    rr=[a[1][2] for a in jd.get('data',[]) if a[1] and a[1][2] is not None]
+    rr=[r for r in rr if not isnan(r)]
+
+    return (fnm, st.st_mtime, st.st_size, timestamp(fnm,st.st_mtime),
+            jd.get('measurement_status'), pc.get('name'),
+            gejournal.confhash(pc.get('conf',[])), pc.get('nprobe'),
+            len(jd.get('data',[])),
+            min(rr) if rr else None, max(rr) if rr else None)
+
+def scan(db, dirname='.', pattern=PATTERN, verbose=False):
+    '''index new and changed files, drop vanished ones, returns (indexed, removed)'''
+    known={a[0]:(a[1],a[2]) for a in db.execute('select path,mtime,size from survey')}
+    found=set()
+    nnew=0
+
+    for fnm in glob.glob(os.path.join(dirname,pattern)):
+        fnm=os.path.abspath(fnm)
+        found.add(fnm)
+        st=os.stat(fnm)
+
+        if known.get(fnm)==(st.st_mtime,st.st_size):
+            continue
+
+        try:
+            row=entry(fnm,st)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            if verbose: print(f'{fnm}: {e}')
+            continue
+
+        db.execute('insert or replace into survey values (%s)'%','.join('?'*len(FIELDS)),row)
+        nnew+=1
+
+    gone=[a for a in known if a not in found and os.path.dirname(a)==os.path.abspath(dirname)]
+    db.executemany('delete from survey where path=?',[(a,) for a in gone])
+    db.commit()
+
+    return nnew,len(gone)
+
+def totime(t):
+    '''timestamp or ISO date'''
+    try:
+        return float(t)
+    except ValueError:
+        return dt.fromisoformat(t).timestamp()
+
+def query(db, status=None, name=None, confhash=None, nprobe=None, since=None, until=None):
+    '''surveys matching all given fields as dicts, ordered by time'''
+    cond=[]
+    arg=[]
+
+    for k,v in (('status',status),('name',name),('confhash',confhash),('nprobe',nprobe)):
+        if v is not None:
+            cond.append(f'{k}=?')
+            arg.append(v)
+
+    if since is not None:
+        cond.append('timestamp>=?')
+        arg.append(totime(since))
+
+    if until is not None:
+        cond.append('timestamp<?')
+        arg.append(totime(until))
+
+    sql='select * from survey'
+    if cond:
+        sql+=' where '+' and '.join(cond)
+
+    return [dict(zip(FIELDS,a)) for a in db.execute(sql+' order by timestamp',arg)]
+
+if __name__ == "__main__":
+    dirname='.'
+    dbname=None
+    sel={}
+    doscan=False
+
+    for arg in sys.argv[1:]:
+        if arg.find('dir=') == 0:
+            dirname=arg.replace('dir=','')
+        elif arg.find('db=') == 0:
+            dbname=arg.replace('db=','')
+        elif arg == 'scan':
+            doscan=True
+        elif '=' in arg:
+            k,v=arg.split('=',1)
+            sel[k]=int(v) if k=='nprobe' else v
+
+    db=connect(dbname or os.path.join(dirname,DBNAME))
+
+    if doscan:
+        print('%d files indexed, %d removed'%scan(db,dirname,verbose=True))
+    else:
+        for s in query(db,**sel):
+            print('%s %-8s %-12s %4d points R %s..%s  %s'%(
+                dt.fromtimestamp(s['timestamp']).strftime('%Y-%m-%d %H:%M'),
+                s['status'], s['name'], s['npoint'], s['rmin'], s['rmax'], s['path']))
+
+    db.close()
@@ -9,11 +9,19 @@
 
 from time import sleep
 from datetime import datetime as dt
+import os
 import sys
 import json
+import shutil
+import tempfile
 import numpy as np
 from math import isnan
 from threading import Thread, Event
+from collections import namedtuple
+import geseq
+import gejournal
+import gedata
+import gelog
 
 # ----------- VARIABLES -----------
 
@@ -37,8 +45,19 @@ devcfg = {
     'injection_volt_limit': 400,
     'injection_volt_low': 18,
     'injection_max_try': 50,
+    'injection_search': 'secant',
     'voltage_limit': 4966.0,
     'max_measurement_try': 10,
+    'optimize_sequence': False,
+    'injection_hold': False,
+    'polarity_reversal': False,
+    'stack_target': 0,      # relative error of V/I, 0: single reading
+    'stack_max': 20,
+    'stack_estimator': 'median',   # mean, median, trimmed, huber
+    'stack_reject': 5.0,    # spike threshold (sigma), 0: keep all
+    'settle_tol': 0.01,     # relative agreement of consecutive readings
+    'binary_data': True,    # columnar copy of the data file (gedata)
+    'log_file': '',         # acquisition log file, '': none
     'filename_prefix': 'data-'
 }
 
@@ -51,57 +70,233 @@ nan=float('nan');
 
 comm='/dev/ttyUSB0'
 speed=9600
+record=None     # trace file of the serial session
+speedup=0.0     # replay speed of a trace (0: as fast as possible)
+recording=None  # trace being recorded
+replaydir=None  # output directory while replaying a trace
 
 boxarr=[] # box figure array (color, values, etc)
 proarr=[] # probe position (surface)
+pconf=None # probe configuration
 resarr={} # measured resistivity array
 probres={} # interprobe resistances
 rmin=0
 rmax=0
 firsttake=True
 probres_avail=False
-logstring=''
+log=gelog.Log(level=gelog.DEBUG)  # acquisition log (ring buffer)
+warmstart={}    # (pm, pp) -> pwm that last reached crange
+prevolt=0       # last injection voltage
+lastpwm=0       # last pwm that reached crange
+lastpair=None   # last injection dipole (pm, pp)
+journal=None    # acquisition journal of the running survey
+logname=None    # file of the log sink, None: no sink
+
+# ---- events to the user interface ----
+# listeners are called from the measurement thread
+
+Point=namedtuple('Point','key values rmin rmax')   # quadrupole measured
+Probe=namedtuple('Probe','pm pp vm vp')             # probes switched
+Resistance=namedtuple('Resistance','pair values')  # interprobe resistance
+Progress=namedtuple('Progress','done total')
+Logged=namedtuple('Logged','level')
+Finished=namedtuple('Finished','status')
+
+listeners=[]
+
+def subscribe(fn):
+    listeners.append(fn)
+
+def publish(ev):
+    for fn in listeners:
+        fn(ev)
+
+def switched():
+    publish(Probe(pm,pp,vm,vp))
+
+def plog(s, level=gelog.INFO):
+    log.write(s,level)
+    publish(Logged(level))
+
+# ---- injection current search ----
+# hist: [(pwm, current), ...] measured so far, pmax: highest pwm
+# under the injection voltage limit, returns the next pwm
+
+def search_step(hist, crange, pmax):
+    p,i=hist[-1]
+    if i<crange[0]:
+        return p+devcfg['injection_pwm_increment']
+    return p-devcfg['injection_pwm_increment']
+
+def bracket(hist, crange, pmax):
+    lo,hi=0,pmax+1
+    for p,i in hist:
+        if i<crange[0] and p>lo and p<=pmax: lo=p
+        if i>crange[1] and p<hi: hi=p
+    return lo,hi
+
+def search_bisect(hist, crange, pmax):
+    lo,hi=bracket(hist, crange, pmax)
+    return (lo+hi)//2
+
+def search_secant(hist, crange, pmax):
+    target=0.5*(crange[0]+crange[1])
+    lo,hi=bracket(hist, crange, pmax)
+    p1,i1=hist[-1]
+
+    if len(hist)>1 and hist[-2][0]!=p1:
+        p0,i0=hist[-2]
+        slope=(i1-i0)/(p1-p0)
+    elif p1>0:
+        slope=i1/p1     # ohmic ground: I proportional to pwm
+    else:
+        slope=0
+
+    if slope<=0:
+        return (lo+hi)//2
+
+    p=int(round(p1+(target-i1)/slope))
+
+    # keep inside the bracket, bisect otherwise
+    if p<=lo or p>=hi:
+        return (lo+hi)//2
+    return p
 
-def plog(s):
-    global logstring
-    logstring+='\n'+s
-    print(s)
+def search_pi(hist, crange, pmax, kp=0.7, ki=0.3):
+    target=0.5*(crange[0]+crange[1])
+    p,i=hist[-1]
+    pa=[a for a,b in hist if a>0]
+    ia=[b for a,b in hist if a>0]
 
-def adjust_measure(crange, ntry=devcfg['injection_max_try']):
-    ip=0.0
+    if not pa or sum(ia)<=0:
+        return search_bisect(hist, crange, pmax)
+
+    slope=sum(ia)/sum(pa)   # mean I/PWM of the search so far
+    integ=sum([target-b for a,b in hist])
+    return int(round(p+(kp*(target-i)+ki*integ)/slope))
+
+current_search={
+    'step': search_step,
+    'bisect': search_bisect,
+    'secant': search_secant,
+    'pi': search_pi
+}
+
+def search_method():
+    '''configured current search, step search for an unknown name'''
+    name=devcfg.get('injection_search','step')
+    if name not in current_search:
+        plog(f'unknown injection search {name}, using step',gelog.WARN)
+        name='step'
+    return name
+
+def volt_cap(hist, vpp):
+    '''highest pwm expected under the injection voltage limit'''
+    if vpp>0:
+        return min(g.PWMMAX,int(devcfg['injection_volt_limit']/vpp))
+
+    # no voltage seen yet: small steps only
+    return min(g.PWMMAX,max(hist[-1][0]+devcfg['injection_pwm_increment'],
+            devcfg['injection_low_pwm']))
+
+def adjust_measure(crange, ntry=devcfg['injection_max_try'], pwm=0):
+    name=search_method()
+    search=current_search[name]
+    vlim=devcfg['injection_volt_limit']
     nt=0
-    vol=0
+    stall=False
 
-    while not (ip>crange[0] and ip<crange[1]):
+    # a warm start is judged on the charged converter
+    if pwm>0:
+        g.settle('A',devcfg.get('settle_tol',0.01))
 
-        if not msrev.is_set():
-            break
-    
-        if ip<crange[0]:
-            g.incr_injection(devcfg['injection_pwm_increment'])
-        elif ip>crange[1]:
-            g.decr_injection(devcfg['injection_pwm_increment'])
+    r=g.measure()
+    ip,vol=r.I,r.J
+    hist=[(pwm,ip)]
+    vpp=vol/pwm if pwm>0 and vol>0 else 0.0    # injection volt per pwm
+
+    while True:
+        while not (ip>crange[0] and ip<crange[1] and vol<=vlim):
+
+            if not msrev.is_set():
+                break
 
-        ip=g.measure_current()
+            # the voltage is predicted before a pwm is applied
+            pmax=volt_cap(hist, vpp)
+            if vol>vlim:
+                pmax=min(pmax,hist[-1][0]-1)    # step back down
+
+            pwm=max(0,min(pmax,search(hist, crange, pmax)))
+
+            if pwm==hist[-1][0]:
+                plog("injection search stalled at pwm=%d"%(pwm),gelog.WARN)
+                stall=True
+                break
+
+            ip,vol=g.set_measure_injection(pwm)
+            hist.append((pwm,ip))
+
+            if pwm>0 and vol>0:
+                vpp=max(vpp,vol/pwm)
+
+            if vol>vlim:
+                plog(f'injection limit exceeded {vol}V, stepping down',gelog.WARN)
+            else:
+                plog("injection: I=%0.3EmA V=%0.3EV pwm=%d (I_limit: %0.2f,%0.2f)"%(ip,vol,pwm,crange[0],crange[1]),gelog.DEBUG)
+            
+            nt+=1
+            if nt>ntry:
+                plog("maximum try...",gelog.WARN)
+                break
+
+        # never measure above the injection voltage limit
+        if vol>vlim:
+            pwm=volt_cap(hist, vpp)
+            if pwm>=hist[-1][0]:
+                pwm=0
+            ip,vol=g.set_measure_injection(pwm)
+            hist.append((pwm,ip))
+            plog(f'injection lowered to pwm={pwm} ({vol}V)',gelog.WARN)
+
+        g.settle('V',devcfg.get('settle_tol',0.01))
         vol=g.measure_injection()
-        
-        if vol>devcfg['injection_volt_limit']:
-            plog(f'injection limit exceeded {vol}V')
+        ip,meter_vol,err=read_point()
+
+        if ip>crange[0] and ip<crange[1] and vol<=vlim:
             break
-            
-        plog("injection: I=%0.3EmA V=%0.3EV (I_limit: %0.2f,%0.2f)"%(ip,vol,crange[0],crange[1]))
-        
-        nt+=1
-        if nt>ntry:
-            plog("maximum try...")
+
+        if stall or nt>ntry or not msrev.is_set() or nocurrent(ip):
             break
 
-    sleep(g.WAIT2)
+        # the search ran on a transient reading, go on from the settled one
+        plog("settled: I=%0.3EmA V=%0.3EV pwm=%d, searching on"%(ip,vol,pwm),gelog.DEBUG)
+        hist[-1]=(pwm,ip)
+        if pwm>0 and vol>0:
+            vpp=vol/pwm
+        nt+=1
+
+    plog("injection search: %d steps (%s)"%(nt,name))
+
+    # pwm is reported only when the settled reading is in crange
+    if not (ip>crange[0] and ip<crange[1] and vol<=vlim):
+        pwm=None
 
-    ip=g.measure_current()
-    meter_vol=g.measure_voltage()
+    return ip, meter_vol, vol, pwm, err
 
-    return ip, meter_vol, vol
+def nocurrent(mi):
+    return mi==0.0 or isnan(mi)
+
+def read_point():
+    '''final reading of a point, stacked when stack_target is set: (I, V, error)'''
+    if devcfg.get('stack_target'):
+        r,err,n,ns=g.stack(devcfg['stack_target'],nmax=devcfg.get('stack_max',20),
+                method=devcfg.get('stack_estimator','mean'),
+                reject=devcfg.get('stack_reject',5.0))
+        plog("stacked %d readings (%d spikes rejected), error %0.2E"%(n,ns,err))
+        return r.I,r.V,err
+
+    r=g.measure()
+    return r.I,r.V,nan
 
 #   ------- UNTESTED ------
 def currentclamp():
@@ -128,13 +323,92 @@ def release_current():
 
 # ----------------------------
 
+def data_prefix():
+    '''filename prefix of the output, a scratch directory while replaying'''
+    if replaydir:
+        return os.path.join(replaydir,os.path.basename(devcfg['filename_prefix']))
+    return devcfg['filename_prefix']
+
+def warmstart_file():
+    '''injection table is kept next to the data files'''
+    return os.path.join(os.path.dirname(data_prefix()), 'warmstart.json')
+
+def load_warmstart():
+    global warmstart
+    try:
+        with open(warmstart_file()) as fl:
+            warmstart={tuple(a[0]):a[1] for a in json.load(fl)}
+    except (OSError, ValueError):
+        warmstart={}
+
+def save_warmstart(fnm=None):
+    try:
+        with open(fnm or warmstart_file(),'w') as fl:
+            json.dump([[list(a),warmstart[a]] for a in warmstart],fl)
+    except OSError as e:
+        print(e)
+        plog('saving injection table failed',gelog.ERROR)
+
+def journal_file():
+    '''the journal is kept next to the data files'''
+    return os.path.join(os.path.dirname(data_prefix()), 'journal.jsonl')
+
+def journal_pending():
+    '''number of points of an interrupted survey of pconf, 0 if none'''
+    if not pconf:
+        return 0
+    done=gejournal.load(journal_file(), pconf['conf'])
+    return len(done) if done else 0
+
+def resume_journal():
+    '''restore the points of an interrupted survey, returns their keys'''
+    global rmin,rmax
+
+    done=gejournal.load(journal_file(), pconf['conf']) or {}
+
+    for a in done:
+        vv=done[a]
+        resarr[a]=(list(a), vv)
+        if vv[2] is not None and not isnan(vv[2]):
+            if rmin>vv[2]: rmin=vv[2]
+            if rmax<vv[2]: rmax=vv[2]
+
+    for a in done:
+        publish(Point(a,done[a],rmin,rmax))
+
+    if done:
+        plog(f'resuming: {len(done)} points from {journal_file()}')
+
+    return done
+
+# ----------------------------
+
+def log_sink():
+    '''open, switch or close the log file on devcfg['log_file']'''
+    global logname
+
+    fnm=devcfg.get('log_file') or None
+    if fnm==logname:
+        return
+
+    try:
+        if fnm:
+            log.open(fnm)
+        else:
+            log.close()
+        logname=fnm
+    except OSError as e:
+        log.close()
+        logname=None
+        plog(f'no log file: {e}',gelog.WARN)
+
 def set_conf(cfg):
     global pconf,resarr, probres, firsttake, probres_avail, devcfg
 
     pconf=cfg
     firsttake=True
     probres_avail=False
-    logstring=''
+    log.clear()
 
     if 'device_configuration' in cfg:
         cc=cfg['device_configuration']
@@ -145,6 +419,7 @@ def set_conf(cfg):
         else:
             cfg['device_configuration']=devcfg
 
+    log_sink()
     resarr={}
 
     for p in pconf['conf']:
@@ -154,124 +429,376 @@ def set_conf(cfg):
         '''probres format: (resistance, injection_voltage, injection_current)'''
         probres[p,p+1]=None
 
-def custom_measurement():  # pc is the probe configuration dict
-    '''read configuration from file'''
+def store(p, mv, mi, sv, err=nan):
+    '''keep one quadrupole result in resarr'''
+    global rmin,rmax
 
-    global rmin,rmax, pm,pp,vm,vp, logstring, abort
-    
-    if not pconf: return
+    if mi!=0.0:
+        mr=abs((mv-sv)/mi)
+        if rmin>mr: rmin=mr
+        if rmax<mr: rmax=mr
+    else:
+        mr=float('nan')
 
-    # clear previous measurement data
-    for p in resarr:
-        resarr[p]=(p, None)
+    resarr[tuple(p[0])]=(p[0], [mv,mi,mr,sv,err])
 
-    if pconf['nprobe'] != g.NPROBE:
-        plog('incompatible configuration: probe {} <-> {}'.format(pconf['nprobe'], nprobe))
-        return
-    
-    rmin,rmax=1e6,0
+    if journal:
+        journal.add(p[0],[mv,mi,mr,sv,err])
 
-    abort=False
+    publish(Point(tuple(p[0]),[mv,mi,mr,sv,err],rmin,rmax))
+    publish(Progress(len([a for a in resarr if resarr[a][1]]),len(resarr)))
 
-    # use previous voltage to discharge
-    prevolt=devcfg['injection_volt_low']
+    plog("R=%0.2EOhm V=%0.2EmV C_inj=%0.2EmA V_self=%0.2EmV err=%0.1E"%(mr,mv,mi,sv,err))
 
-    for p in pconf['conf']:
+def start_injection(pm,pp,vm,vp):
+    '''inject on the current dipole, warm started, returns (I, V, pwm, error)'''
+    global prevolt, lastpwm
+
+    pwm=warmstart.get((pm,pp),lastpwm)
+    g.probe_inject(pm,pp,vm,vp,pwm)
+
+    mi,mv,prevolt,pwm,err=adjust_measure(devcfg['crange'],pwm=pwm)
+
+    if pwm is not None:
+        warmstart[pm,pp]=pwm
+        lastpwm=pwm
+
+    return mi,mv,pwm,err
+
+def reverse(pa,pb,vm,vp):
+    '''inject at the same pwm on pa, pb and read: (I, V, error)'''
+    g.inject(False)
+    g.probe(pa,pb,vm,vp)
+    g.inject()
+    g.settle('V',devcfg.get('settle_tol',0.01))
+    return read_point()
+
+def reversal_injection(pm,pp,vm,vp):
+    '''
+    polarity reversal +/-/+: V+ = R*I+ + SP, V- = -R*I- + SP.
+    The self potential drops out of R=(V+ - V-)/(I+ + I-); the two
+    positive reads are averaged, so a drift linear in time between
+    equally spaced reads drops out as well.
+    returns (I+, V+, SP, error)
+    '''
+    mi,mv,pwm,err=start_injection(pm,pp,vm,vp)
+
+    # same pwm, swapped injection probes, then back
+    mi2,mv2,err2=reverse(pp,pm,vm,vp)
+
+    if nocurrent(mi2):
+        return mi2,mv2,0.0,err2
+
+    if mv2>devcfg['voltage_limit']:
+        return mi,mv2,0.0,err
+
+    mi3,mv3,err3=reverse(pm,pp,vm,vp)
+
+    if nocurrent(mi3):
+        return mi3,mv3,0.0,err3
+
+    if mv3>devcfg['voltage_limit']:
+        return mi3,mv3,0.0,err3
+
+    mi=0.5*(mi+mi3)
+    mv=0.5*(mv+mv3)
+    err=0.5*(err*err+err3*err3)**0.5
+
+    if mi+mi2!=0.0:
+        sv=mv-mi*(mv-mv2)/(mi+mi2)
+    else:
+        sv=0.5*(mv+mv2)
+
+    plog("reversed: V=%0.2EmV C_inj=%0.2EmA"%(mv2,mi2))
+    return mi,mv,sv,0.5*(err*err+err2*err2)**0.5
+
+def measure_point(p):
+    '''one quadrupole: self potential, injection, measurement'''
+    global pm,pp,vm,vp, abort, lastpair
+
+    pm=p[1][0]
+    pp=p[1][1]
+    vm=p[1][2]
+    vp=p[1][3]
+
+    plog("> {} probe conf: pm={} pp={} vm={} vp={}".format(p[0],pm,pp,vm,vp))
+    switched()
+    
+    ntry=0
+
+    # the same current dipole is re-injected at the same pwm
+    if (pm,pp)!=lastpair:
+        g.discharge(prevolt,verbose=True)
+    lastpair=(pm,pp)
+
+    while ntry<devcfg['max_measurement_try']:
 
         if not msrev.is_set(): 
-            plog('measurement aborted')
+            plog('measurement aborted',gelog.WARN)
             abort=True
             break;
 
-        pm=p[1][0]
-        pp=p[1][1]
-        vm=p[1][2]
-        vp=p[1][3]
+        ntry+=1
+        
+        # 1. discharge. The potential probes of the previous point are
+        # kept, a translated configuration is reached by shifting.
+        if ntry>1:
+            g.release()
+        else:
+            g.inject(False)
+        #g.discharge(devcfg['injection_volt_low'],verbose=True)
+        sleep(g.WAIT)
+
+        if devcfg.get('polarity_reversal'):
+            # 2'. both polarities, no separate self potential phase
+            mi,mv,sv,err=reversal_injection(pm,pp,vm,vp)
 
-        plog("> {} probe conf: pm={} pp={} vm={} vp={}".format(p[0],pm,pp,vm,vp))
+            if nocurrent(mi):
+                plog('no injection current... retrying...',gelog.WARN)
+                g.probe_off()
+                continue
+
+            if mv>devcfg['voltage_limit']:
+                plog(f'volt measurement limit {mv}... retrying...',gelog.WARN)
+                g.probe_off()
+                continue
+
+            store(p,mv,mi,sv,err)
+            g.inject(False)
+            g.probe(0,0,vm,vp)  # injection probes off
+            break
         
-        ntry=0
-        g.discharge(prevolt,verbose=True)
+        # 2. measure self potential
+        g.probe(0,0,vm,vp,force=ntry>1)   # refresh relays on retry
+        sv=g.measure_voltage()
+
+        if sv>devcfg['voltage_limit']:
+            plog(f'volt measurement limit (sv)',gelog.WARN)
+            g.probe_off()
+            break
+        
+        # 3. current injection and measurement
 
-        while ntry<devcfg['max_measurement_try']:
+        g.inject(False)  # release first
+        sleep(g.WAIT)
 
-            if not msrev.is_set(): 
-                plog('measurement aborted')
-                abort=True
-                break;
+        mi,mv,pwm,err=start_injection(pm,pp,vm,vp)
 
-            ntry+=1
-            
-            # 1. discharge
+        if nocurrent(mi):
+            plog('no injection current... retrying...',gelog.WARN)
             g.probe_off()
-            g.inject(False)
-            #g.discharge(devcfg['injection_volt_low'],verbose=True)
+            continue
+
+        if mv>devcfg['voltage_limit']:
+            plog(f'volt measurement limit {mv}... retrying...',gelog.WARN)
+            g.probe_off()
+            continue
+
+        store(p,mv,mi,sv,err)
+
+        g.inject(False)
+        g.probe(0,0,vm,vp)  # injection probes off
+        break
+
+def hold_measurement(grp):
+    '''
+    injection-hold mode: inject once on the current dipole shared by
+    the entries of grp and switch only the potential probes.
+    Returns the entries left for the per-point measurement.
+    '''
+    global pm,pp,vm,vp, lastpair, prevolt
+
+    crange=devcfg['crange']
+    pm,pp=grp[0][1][0],grp[0][1][1]
+
+    plog("> hold injection pm={} pp={}: {} potential dipoles".format(pm,pp,len(grp)))
+
+    if (pm,pp)!=lastpair:
+        g.discharge(prevolt,verbose=True)
+    lastpair=(pm,pp)
+
+    # 1. self potentials, no injection
+    g.inject(False)
+    sleep(g.WAIT)
+    sv=[]
+
+    for p in grp:
+        if not msrev.is_set(): return []
+        vm,vp=p[1][2],p[1][3]
+        g.probe(0,0,vm,vp)
+        sv.append(g.measure_voltage())
+
+    # 2. one injection for the whole group
+    vm,vp=grp[0][1][2],grp[0][1][3]
+    switched()
+    mi,mv,pwm,err=start_injection(pm,pp,vm,vp)
+
+    if pwm is None:
+        plog('no stable injection, measuring point by point',gelog.WARN)
+        g.inject(False)
+        return grp
+
+    # 3. potential dipoles under the held current
+    left=[]
+
+    for k in range(len(grp)):
+        if not msrev.is_set(): return []
+
+        p=grp[k]
+        vm,vp=p[1][2],p[1][3]
+
+        if k>0:
+            g.probe(pm,pp,vm,vp)
+            switched()
             sleep(g.WAIT)
-            
-            # 2. measure self potential
-            g.probe(0,0,vm,vp)
-            sv=g.measure_voltage()
+            mi,mv,err=read_point()
 
-            if sv>devcfg['voltage_limit']:
-                plog(f'volt measurement limit (sv)')
-                g.probe_off()
+        if not (mi>crange[0] and mi<crange[1]):
+            plog('injection drifted, readjusting',gelog.WARN)
+            mi,mv,prevolt,pwm,err=adjust_measure(crange,pwm=pwm)
+            if pwm is None:
+                left+=grp[k:]
                 break
-            
-            # 3. current injection and measurement
 
-            g.inject(False)  # release first
-            sleep(g.WAIT)
+        plog("> {} probe conf: pm={} pp={} vm={} vp={}".format(p[0],pm,pp,vm,vp))
 
-            g.probe(pm,pp,vm,vp)
-            g.set_injection(prevolt)
-            g.inject()
+        if sv[k]>devcfg['voltage_limit'] or mv>devcfg['voltage_limit']:
+            plog(f'volt measurement limit {mv}... retrying later...',gelog.WARN)
+            left.append(p)
+            continue
 
-            mi,mv,prevolt=adjust_measure(devcfg['crange'])
+        store(p,mv,mi,sv[k],err)
 
-            if mv>devcfg['voltage_limit']:
-                plog(f'volt measurement limit {mv}... retrying...')
-                g.probe_off()
-                continue
-           
-            if mi!=0.0:
-                mr=abs((mv-sv)/mi)
-                if rmin>mr: rmin=mr
-                if rmax<mr: rmax=mr
-            else:
-                mr=float('nan')
+    g.inject(False)
+    g.probe(0,0,vm,vp)  # injection probes off
+    return left
 
-            resarr[tuple(p[0])]=(p[0], [mv,mi,mr,sv])
-            plog("R=%0.2EOhm V=%0.2EmV C_inj=%0.2EmA V_self=%0.2EmV"%(mr,mv,mi,sv))
-            break
+def custom_measurement(resume=False):  # pc is the probe configuration dict
+    '''
+    read configuration from file, with resume the points of an
+    interrupted survey are taken from the journal and skipped
+    '''
+
+    global rmin,rmax, pm,pp,vm,vp, abort, prevolt, lastpwm, lastpair, journal
+    
+    if not pconf:
+        publish(Finished('aborted'))
+        return
+
+    # clear previous measurement data
+    for p in resarr:
+        resarr[p]=(p, None)
+
+    if pconf['nprobe'] != g.NPROBE:
+        plog('incompatible configuration: probe {} <-> {}'.format(pconf['nprobe'], g.NPROBE),gelog.ERROR)
+        publish(Finished('aborted'))
+        return
+    
+    rmin,rmax=1e6,0
+
+    abort=False
+
+    # use previous voltage to discharge
+    prevolt=devcfg['injection_volt_low']
+    lastpwm=devcfg['injection_low_pwm']
+    lastpair=None
+    load_warmstart()
+
+    # a replay of the trace starts from the same injection table
+    if recording:
+        save_warmstart(recording+'.warmstart.json')
+
+    done=resume_journal() if resume else {}
+    try:
+        journal=gejournal.Journal(journal_file(), pconf['conf'], append=bool(done))
+        # the torn line of the interruption is gone, appended points must reload
+        if done and len(gejournal.load(journal_file(), pconf['conf']) or {})!=len(done):
+            plog('journal does not reload after resume',gelog.WARN)
+    except OSError as e:
+        print(e)
+        plog('no acquisition journal',gelog.WARN)
+        journal=None
+
+    seq=[p for p in pconf['conf'] if tuple(p[0]) not in done]
+    if devcfg.get('optimize_sequence'):
+        opt=geseq.optimize(seq)
+        plog(geseq.report(seq,opt))
+        seq=opt
+
+    # injection hold: entries grouped by their current dipole
+    hold=devcfg.get('injection_hold')
+    if hold and devcfg.get('polarity_reversal'):
+        plog('injection hold does not reverse the polarity, measuring point by point',gelog.WARN)
+        hold=False
+
+    if hold:
+        grp={}
+        for p in seq:
+            grp.setdefault((p[1][0],p[1][1]),[]).append(p)
+        grp=list(grp.values())
+    else:
+        grp=[[p] for p in seq]
+
+    for gg in grp:
+
+        if not msrev.is_set(): 
+            plog('measurement aborted',gelog.WARN)
+            abort=True
+            break;
+
+        if len(gg)>1:
+            gg=hold_measurement(gg)
+
+        for p in gg:
+            if not msrev.is_set(): break
+            measure_point(p)
         
-    g.probe_off()   # turn off relays
-    g.inject(False)
+    if not msrev.is_set():
+        abort=True
+
+    g.release()   # turn off relays
     g.discharge(devcfg['injection_volt_low'])
     g.flush()
     pm,pp,vm,vp=0,0,0,0
+    switched()
     msrev.clear()
-    saveData()
+    save_warmstart()
+
+    # an aborted survey keeps its journal for resuming
+    if journal:
+        if saveData() and not abort:
+            journal.remove()
+        else:
+            journal.close()
+        journal=None
+    else:
+        saveData()
+
+    if replaydir:
+        plog(f'replay: {g.ser.skipped} recorded polls skipped')
+
+    publish(Finished('aborted' if abort else 'success'))
 
 def measure_resistances():
-    global probres, logstring, probres_avail
+    global probres, probres_avail
 
     for pr in probres:
         probres[pr]=None
 
-    logstring=''
+    log.clear()
     
     for p in range(1, pconf['nprobe']):
 
         if not msrev.is_set(): break
         
         g.discharge(devcfg['injection_volt_low'])
-        sleep(g.WAIT2)
         g.set_injection(devcfg['injection_low_pwm'])
         g.probe(p,p+1,0,0)
+        publish(Probe(p,p+1,0,0))
+        g.settle('A',devcfg.get('settle_tol',0.01))
         
-        I=g.measure_current()
-        V=g.measure_injection()
-        S=g.measure_shunt()
+        r=g.measure()
+        I,V,S=r.I,r.J,r.S
         
         try:
             probres[p,p+1]=((V+S)/I,V+S,I)
@@ -279,43 +806,44 @@ def measure_resistances():
             probres[p,p+1]=(nan,V+S,I)
 
         plog('I=%0.4f V=%0.4f S=%0.2f'%(I,V,S))
+        publish(Resistance((p,p+1),probres[p,p+1]))
+        publish(Progress(p,pconf['nprobe']-1))
         g.inject(False)
-        sleep(0.2)
+        sleep(g.INJ_OFF_WAIT)
         g.shift()
         g.inject()
         
     g.probe_off()   
+    publish(Probe(0,0,0,0))
+    status='success' if msrev.is_set() else 'aborted'
     msrev.clear()
     probres_avail=True
+    publish(Finished(status))
 
-def resmap(p, clr):
-    nn=len(clr)
-    
-    if rmax == rmin:
+def colorindex(r, nn, rmin, rmax):
+    '''color of resistance r on a scale of nn colors, 0: no value'''
+    if rmax == rmin or r is None or isnan(r):
         return 0
-    
-    vv=resarr[p][1]
-    if vv:
-        if not isnan(vv[2]):
-            c=1+int(nn*(vv[2]-rmin)/(rmax-rmin))
-        else:
-            c=0
-    else:
-        c=0
+
+    c=1+int(nn*(r-rmin)/(rmax-rmin))
 
     # just in case
     if c<0: c=0
     if c>=nn: c=nn-1
     return c
 
+def resmap(p, clr):
+    vv=resarr[p][1]
+    return colorindex(vv[2] if vv else None, len(clr), rmin, rmax)
+
 def saveData():
     try:
-        fnm=devcfg['filename_prefix']+str(int(dt.timestamp(dt.now())))+'.json'
+        fnm=data_prefix()+str(int(dt.timestamp(dt.now())))+'.json'
         plog(f'saving data to {fnm}')
         jdata={ 
                 'comment':'Geoelectric measurement data\nrosandi, 2020\n'+
                 'Geophysics Universitas Padjadjaran',
-                'measurement_fields': '[cell_i, cell_j], [V, I, R, V_self]'
+                'measurement_fields': '[cell_i, cell_j], [V, I, R, V_self, R_err]'
             }
 
         if abort:
@@ -341,17 +869,47 @@ def saveData():
         with open(fnm,'w') as fl:
             json.dump(jdata,fl)
 
+        if devcfg.get('binary_data'):
+            gedata.save(fnm[:-5]+gedata.EXT,jdata)
+
+        return True
+
     except Exception as e:
         print(e)
-        plog('saving data failed')
+        plog('saving data failed',gelog.ERROR)
+        return False
    
-def init_dev(comm,speed,cal=True):
-    global g
+def init_dev(comm,speed,cal=True,record=None,speedup=0.0):
+    global g, recording, replaydir
+
+    recording=record
+    replaydir=None
+
+    log_sink()
 
     try:
         plog('initialize...')
         import gelec as g
-        g.init(comm,speed)
+
+        if comm.endswith('.trace'):
+            plog(f'replaying {comm}')
+            g.replay(comm,speedup)
+            cal=False
+
+            # the recording asked the identity for its timing profile
+            plog(f'recorded device: {g.device_id()}')
+
+            # warm start table, journal and data of the replay stay
+            # out of the data directory
+            replaydir=tempfile.mkdtemp(prefix='gereplay-')
+            if os.path.exists(comm+'.warmstart.json'):
+                shutil.copy(comm+'.warmstart.json',warmstart_file())
+            plog(f'replay output in {replaydir}')
+        else:
+            g.init(comm,speed,record=record)
+
+            if g.load_timing():
+                plog('device timing profile loaded')
         
         if cal:
             plog('calibrating...')
@@ -380,12 +938,16 @@ if __name__ == "__main__":
             comm=arg.replace('comm=','')
         if arg.find('speed=') == 0:
             speed=int(arg.replace('speed=',''))
+        if arg.find('record=') == 0:
+            record=arg.replace('record=','')
+        if arg.find('speedup=') == 0:
+            speedup=float(arg.replace('speedup=',''))
 
     if not comm:
         print("arguments required: comm=[comm-port]")
         exit(-1)
     
-    init_dev(comm, speed, cal=False)
+    init_dev(comm, speed, cal=False, record=record, speedup=speedup)
 
      # don't forget to initialize first
    
@@ -395,6 +957,7 @@ if __name__ == "__main__":
             
             if cmdln.find('q') == 0:
                 g.close()
+                log.close()
                 break
             
             elif cmdln.find('probe')==0:
@@ -406,9 +969,16 @@ if __name__ == "__main__":
 
             elif cmdln.find('conf') == 0:
                 confile=cmdln.replace('conf=','')
+                try:
+                    with open(confile) as fl:
+                        set_conf(json.load(fl))
+                except (OSError, ValueError, KeyError) as e:
+                    print(f'{confile}: {e}')
 
             elif cmdln.find('acq') == 0:
-                custom_measurement(confile)
+                # acq [resume]
+                msrev.set()
+                custom_measurement(resume='resume' in cmdln.split())
 
             elif cmdln.find('mres') == 0:
                 measure_resistance()
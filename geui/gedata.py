@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Columnar survey data file (.ged)
+#
+# MAGIC, header length (uint32), JSON header, padding to 64
+# bytes, then one fixed size record per conf entry:
+#   cell (2 x int32), quad pm pp vm vp (4 x int16),
+#   V, I, R, SP, err (float64, nan: not measured)
+# The records are memory-mapped on loading. The header holds
+# the metadata of the JSON data file and the probe configuration
+# without its conf list.
+#
+#   python3 gedata.py data-*.json    (convert JSON data files)
+#---------------------------------------------------------
+
+import sys
+import json
+import struct
+import numpy as np
+
+MAGIC=b'GEDATA\x01\x00'
+HLEN=struct.Struct('<I')
+ALIGN=64
+EXT='.ged'
+
+DTYPE=np.dtype([
+    ('cell','<i4',(2,)),
+    ('quad','<i2',(4,)),
+    ('V','<f8'),
+    ('I','<f8'),
+    ('R','<f8'),
+    ('SP','<f8'),
+    ('err','<f8')
+])
+
+FIELDS=('V','I','R','SP','err')
+
+def records(jdata):
+    '''structured array of a data dict as written by gectr.saveData'''
+    conf=jdata['conf']['conf']
+    rec=np.zeros(len(conf),dtype=DTYPE)
+    row={}
+
+    for k in range(len(conf)):
+        rec['cell'][k]=conf[k][0]
+        rec['quad'][k]=conf[k][1]
+        row[tuple(conf[k][0])]=k
+
+    for f in FIELDS:
+        rec[f]=np.nan
+
+    for cell,val in jdata['data']:
+        k=row[tuple(cell)]
+        for f,v in zip(FIELDS,val):
+            rec[f][k]=np.nan if v is None else v
+
+    return rec
+
+def save(fnm, jdata):
+    '''write the data dict of gectr.saveData in columnar form'''
+    rec=records(jdata)
+    head={a:jdata[a] for a in jdata if a not in ('data','conf')}
+    head['conf']={a:jdata['conf'][a] for a in jdata['conf'] if a!='conf'}
+    head['nrec']=len(rec)
+
+    hb=json.dumps(head).encode()
+    off=len(MAGIC)+HLEN.size+len(hb)
+    pad=-off%ALIGN
+
+    with open(fnm,'wb') as fl:
+        fl.write(MAGIC+HLEN.pack(len(hb)+pad)+hb+b' '*pad)
+        fl.write(rec.tobytes())
+
+def load(fnm):
+    '''returns (header, records), records memory-mapped read only'''
+    with open(fnm,'rb') as fl:
+        buf=fl.read(len(MAGIC)+HLEN.size)
+        if buf[:len(MAGIC)]!=MAGIC:
+            raise ValueError(f'{fnm}: not a survey data file')
+        n,=HLEN.unpack_from(buf,len(MAGIC))
+        head=json.loads(fl.read(n))
+
+    off=len(MAGIC)+HLEN.size+n
+
+    if head['nrec']==0:
+        return head,np.zeros(0,dtype=DTYPE)
+
+    return head,np.memmap(fnm,dtype=DTYPE,mode='r',offset=off,shape=(head['nrec'],))
+
+def to_json(head, rec):
+    '''data dict in the JSON layout of gectr.saveData'''
+    jdata={a:head[a] for a in head if a not in ('conf','nrec')}
+    data=[]
+    conf=[]
+
+    for r in rec:
+        cell=r['cell'].tolist()
+        conf.append([cell,r['quad'].tolist()])
+        if not np.isnan(r['I']):
+            data.append([cell,[float(r[f]) for f in FIELDS]])
+
+    jdata['data']=data
+    jdata['conf']=dict(head['conf'])
+    jdata['conf']['conf']=conf
+    return jdata
+
+def convert(fnm, out=None):
+    '''JSON data file to .ged, returns the output name'''
+    if out is None:
+        out=fnm[:-5]+EXT if fnm.endswith('.json') else fnm+EXT
+
+    with open(fnm) as fl:
+        save(out,json.load(fl))
+
+    return out
+
+if __name__ == "__main__":
+    if len(sys.argv)<2:
+        print("arguments required: data.json [data.json ...]")
+        exit(-1)
+
+    for fnm in sys.argv[1:]:
+        try:
+            print(f'{fnm} -> {convert(fnm)}')
+        except (OSError, ValueError, KeyError) as e:
+            print(f'{fnm}: {e}')
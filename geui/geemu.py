@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# IGF-02 firmware emulator on a pseudo terminal (Linux)
+#
+# Speaks the serial protocol of the instrument, so the real
+# gelec.py code path can be benchmarked without hardware:
+#   python3 geemu.py [speed=9600] [bench=dipol.json] [record=x.trace] [resume]
+#---------------------------------------------------------
+
+import os
+import pty
+import tty
+import sys
+import select
+from time import sleep, monotonic
+from math import exp
+from random import gauss
+from threading import Thread, Event
+
+NPROBE=16
+PWMMAX=255
+VMAX=400.0          # converter output at full pwm (V)
+TAU_CHARGE=0.3      # converter charge time constant (s)
+TAU_DISCHARGE=2.0   # capacitor discharge time constant (s)
+RELAY_SETTLE=0.02   # relay switching time (s)
+ADC_SAMPLE=0.001    # single ADC conversion (s)
+CONTACT=1500.0      # probe contact resistance (Ohm)
+RHO=100.0           # ground resistivity (Ohm m)
+SPACING=1.0         # probe spacing (m)
+SHUNT=1.0           # shunt resistor (Ohm)
+NOISE=0.002         # relative reading noise
+
+class Firmware:
+    def __init__(_, speed=9600):
+        _.speed=speed
+        _.relay='-'*(4*NPROBE)
+        _.pwm=0
+        _.navg=1
+        _.injecting=False
+        _.jv=0.0
+        _.jt=monotonic()
+        _.offset=(0.0,0.0,1000)
+
+    # ---- physics ----
+
+    def _vtarget(_):
+        if _.injecting:
+            return VMAX*_.pwm/PWMMAX
+        return 0.0
+
+    def injection_voltage(_):
+        '''converter/capacitor voltage following a first order response'''
+        t=monotonic()
+        tau=TAU_CHARGE if _.injecting else TAU_DISCHARGE
+        vt=_._vtarget()
+        return vt+(_.jv-vt)*exp(-(t-_.jt)/tau)
+
+    def _update(_):
+        _.jv=_.injection_voltage()
+        _.jt=monotonic()
+
+    def _probes(_):
+        '''active probes (pm, pp, vm, vp) from the relay pattern'''
+        prb=[]
+        for k in range(4):
+            seg=_.relay[k*NPROBE:(k+1)*NPROBE]
+            prb.append(NPROBE-seg.index('X') if 'X' in seg else 0)
+        vp,vm,pp,pm=prb
+        return pm,pp,vm,vp
+
+    def _transfer(_):
+        '''potential/current ratio of the quadrupole (half space)'''
+        pm,pp,vm,vp=_._probes()
+        if not (pm and pp and vm and vp):
+            return 0.0
+        g=0.0
+        for c,s in ((pp,1),(pm,-1)):
+            for v,t in ((vp,1),(vm,-1)):
+                r=abs(v-c)*SPACING or SPACING/2
+                g+=s*t/r
+        return RHO*g/(2*3.14159265)
+
+    def _noisy(_, x):
+        return x*(1+gauss(0,NOISE)/_.navg**0.5)
+
+    def current(_):
+        '''injection current in mA'''
+        pm,pp,vm,vp=_._probes()
+        if not (pm and pp):
+            return 0.0
+        rg=2*CONTACT+RHO/(3.14159265*SPACING)*abs(pp-pm)**0.2
+        return _._noisy(1000.0*_.injection_voltage()/rg)
+
+    def voltage(_):
+        '''potential probe voltage in mV'''
+        pm,pp,vm,vp=_._probes()
+        if not (vm and vp):
+            return 0.0
+        sp=0.5*(vp-vm)
+        return _._noisy(_.current()*_._transfer()+sp)
+
+    def _adc(_):
+        sleep(ADC_SAMPLE*_.navg)
+
+    # ---- protocol ----
+
+    def _setrelay(_, pattern):
+        n=sum([a!=b for a,b in zip(_.relay,pattern)])
+        _.relay=pattern
+        if n:
+            sleep(RELAY_SETTLE)
+
+    def _shift(_, n):
+        segs=[_.relay[k*NPROBE:(k+1)*NPROBE] for k in range(4)]
+        _._setrelay(''.join([s[n:]+s[:n] for s in segs]))
+
+    def _setpwm(_, pwm):
+        _._update()
+        _.pwm=max(0,min(PWMMAX,pwm))
+
+    def _int(_, a, default=0):
+        '''atoi-like argument parsing of the firmware'''
+        try:
+            return int(float(a[0]))
+        except (IndexError, ValueError):
+            return default
+
+    def _float(_, a, default=0.0):
+        '''atof-like argument parsing of the firmware'''
+        try:
+            return float(a[0])
+        except (IndexError, ValueError):
+            return default
+
+    def command(_, ln):
+        c=ln[:1]
+        a=ln[1:].split()
+
+        if not c:
+            return ''
+
+        if c=='p':
+            _._setrelay(ln[1:].strip().ljust(4*NPROBE,'-')[:4*NPROBE])
+        elif c=='q':
+            _._setrelay('-'*(4*NPROBE))
+        elif c=='s':
+            _._shift(_._int(a[1:],1))
+        elif c=='v':
+            _._setpwm(_._int(a))
+            return f'v {_.pwm}'
+        elif c=='i':
+            _._setpwm(_.pwm+len(ln.strip()))
+            return f'i {_.pwm}'
+        elif c=='d':
+            _._setpwm(_.pwm-len(ln.strip()))
+            return f'd {_.pwm}'
+        elif c in ('Z','D'):
+            _._update()
+            _.injecting=(c=='Z')
+        elif c=='n':
+            _.navg=max(1,min(50,_._int(a,1)))
+        elif c=='c':
+            _.offset=(_._float(a),_._float(a[1:]),_._int(a[2:]))
+        elif c=='C':
+            return '%0.4f %0.4f'%_.offset[:2]
+        elif c=='m':
+            _._adc()
+            return '%0.4f %0.4f %0.4f'%(_.voltage(),_.current(),_.injection_voltage())
+        elif c=='A':
+            _._adc()
+            return '%0.4f'%_.current()
+        elif c=='J':
+            _._adc()
+            return '%0.4f'%_.injection_voltage()
+        elif c=='S':
+            _._adc()
+            return '%0.4f'%(_.current()*SHUNT)
+        elif c=='V':
+            _._adc()
+            return '%0.4f'%_.voltage()
+        elif c=='?':
+            return ('IGF-02 emulator\nnprobe %d\npwm %d\nnavg %d\nspeed %d'%
+                    (NPROBE,_.pwm,_.navg,_.speed))
+
+        return f'{c} ok'
+
+    # ---- serial line ----
+
+    def _wire(_, nbytes):
+        '''time on the wire at the emulated baud rate (8N1)'''
+        sleep(10.0*nbytes/_.speed)
+
+    def serve(_, fd, stop):
+        rx=b''
+        while not stop.is_set():
+            r,w,x=select.select([fd],[],[],0.1)
+            if not r:
+                continue
+            try:
+                rx+=os.read(fd,1024)
+            except OSError:
+                break
+
+            while b'\n' in rx:
+                ln,rx=rx.split(b'\n',1)
+                _._wire(len(ln)+1)
+                rep=_.command(ln.decode('ascii','replace').strip('\r'))
+                tx=bytes(rep.replace('\n','\r\n')+'\r\n','ascii')
+                _._wire(len(tx))
+                os.write(fd,tx)
+
+def start(speed=9600):
+    '''run the emulator in a background thread, returns (device, stop event)'''
+    master,slave=pty.openpty()
+    tty.setraw(slave)
+    stop=Event()
+    fw=Firmware(speed)
+    Thread(target=fw.serve, args=(master,stop), daemon=True).start()
+    return os.ttyname(slave), stop
+
+def bench(cfgname, speed=9600, record=None, resume=False):
+    import json
+    import gectr as gc
+
+    dev,stop=start(speed)
+    gc.init_dev(dev, speed, cal=False, record=record)
+
+    with open(cfgname) as fl:
+        gc.set_conf(json.load(fl))
+
+    t0=monotonic()
+    gc.msrev.set()
+    gc.custom_measurement(resume)
+    dt=monotonic()-t0
+
+    gc.g.close()
+    stop.set()
+    n=len(gc.pconf['conf'])
+    print('%d configurations in %0.1fs (%0.2fs/point)'%(n,dt,dt/n))
+
+if __name__ == "__main__":
+    speed=9600
+    cfgname=None
+    record=None
+    resume=False
+
+    for arg in sys.argv:
+        if arg.find('speed=') == 0:
+            speed=int(arg.replace('speed=',''))
+        if arg.find('bench=') == 0:
+            cfgname=arg.replace('bench=','')
+        if arg.find('record=') == 0:
+            record=arg.replace('record=','')
+        if arg == 'resume':
+            resume=True
+
+    if cfgname:
+        bench(cfgname, speed, record, resume)
+    else:
+        dev,stop=start(speed)
+        print(f'IGF-02 emulator on {dev} ({speed} baud), ctrl-c to stop')
+        try:
+            while True:
+                sleep(1)
+        except KeyboardInterrupt:
+            stop.set()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Append-only acquisition journal
+#
+# One JSON line per measured quadrupole, written as the point
+# completes and synced to disk every nflush points. The first
+# line identifies the probe configuration, so an interrupted
+# survey can be resumed with the same conf only:
+#   {"journal": 1, "conf": <hash>, "time": <timestamp>}
+#   [[cell_i, cell_j], [V, I, R, V_self, R_err]]
+#---------------------------------------------------------
+
+import os
+import json
+import hashlib
+from time import time
+
+VERSION=1
+
+def confhash(conf):
+    '''hash of the quadrupole list of a probe configuration'''
+    return hashlib.sha1(json.dumps(conf,sort_keys=True).encode()).hexdigest()
+
+class Journal:
+    def __init__(_, fnm, conf, append=False, nflush=8):
+        _.fnm=fnm
+        _.nflush=nflush
+        _.nrec=0
+
+        if append:
+            # drop a line cut by a crash, new points go after the last complete one
+            _.fl=open(fnm,'r+')
+            _.fl.truncate(complete(fnm))
+            _.fl.seek(0,os.SEEK_END)
+        else:
+            _.fl=open(fnm,'w')
+            _.fl.write(json.dumps({'journal':VERSION,'conf':confhash(conf),'time':time()})+'\n')
+            _.sync()
+
+    def sync(_):
+        _.fl.flush()
+        os.fsync(_.fl.fileno())
+        _.nrec=0
+
+    def add(_, cell, val):
+        _.fl.write(json.dumps([list(cell),val])+'\n')
+        _.nrec+=1
+        if _.nrec>=_.nflush:
+            _.sync()
+
+    def close(_):
+        if not _.fl.closed:
+            _.sync()
+            _.fl.close()
+
+    def remove(_):
+        _.close()
+        try:
+            os.remove(_.fnm)
+        except OSError:
+            pass
+
+def lines(fnm):
+    '''
+    parsed lines of a journal with the byte offset of their end,
+    up to the first line cut by a crash
+    '''
+    with open(fnm,'rb') as fl:
+        buf=fl.read()
+
+    end=0
+    while True:
+        k=buf.find(b'\n',end)
+        if k<0:
+            return
+        try:
+            obj=json.loads(buf[end:k])
+        except ValueError:
+            return
+        end=k+1
+        yield obj,end
+
+def complete(fnm):
+    '''byte offset after the last complete line'''
+    end=0
+    for obj,end in lines(fnm):
+        pass
+    return end
+
+def load(fnm, conf):
+    '''
+    completed points {(cell_i, cell_j): values} of a journal written
+    for conf, None when there is no journal for this configuration.
+    A line cut by a crash ends the journal.
+    '''
+    try:
+        rd=lines(fnm)
+        head,end=next(rd)
+        if head.get('journal')!=VERSION or head.get('conf')!=confhash(conf):
+            return None
+    except (OSError, StopIteration, AttributeError):
+        return None
+
+    done={}
+    for val,end in rd:
+        try:
+            cell,val=val
+            done[tuple(cell)]=val
+        except (TypeError, ValueError):
+            break
+
+    return done
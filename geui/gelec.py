@@ -7,9 +7,14 @@
 #  (c) Rosandi, 2020
 #---------------------------------------------------------
 
-from time import sleep
+from collections import namedtuple
+import time
+from math import log
 import serial
 import sys
+import json
+import getrace
+import gestack
 
 ser=None
 NPROBE=16
@@ -17,7 +22,40 @@ READY=False
 current_offset=0.0
 WAIT=0.5
 WAIT2=2
+INIT_WAIT=2     # board reset after opening the port
+INJ_OFF_WAIT=0.2    # injection off before switching under no current
 HVREF=1000
+PWMMAX=255
+RXBUF=64    # firmware serial receive buffer (bytes)
+RELAY_WAIT=0.5  # relay break time before switching to a new pattern
+POT_WAIT=0.5    # break when only potential relays change, shortened by getune
+INJ_WAIT=0.2    # converter response after a pwm change
+SETTLE_POLL=0.1 # polling interval of the settle detection
+DIS_SAMPLE=0.2  # first sample interval of the discharge fit
+DIS_POLL=1.0    # discharge polling when no decay can be fitted
+discharge_tau=None  # fitted discharge time constant (s)
+
+# per-device timing profile, see getune.py
+TIMING=['WAIT','WAIT2','RELAY_WAIT','POT_WAIT','INJ_WAIT','INJ_OFF_WAIT',
+        'SETTLE_POLL','DIS_SAMPLE']
+TIMING_FILE='timing.json'
+timescale=1.0   # host side waits are divided by it, 0: no waiting (replay)
+_unscaled=None  # timing before scaling
+relays=None     # relay pattern last sent to the device, None: unknown
+
+# one complete reading: probe voltage (mV), injection current (mA),
+# injection voltage (V) and shunt voltage (mV)
+Reading=namedtuple('Reading', 'V I J S')
+
+# reply framing of the firmware, keyed by the command character
+#   int  -> number of reply lines
+#   str  -> reply ends with this prompt/terminator
+#   None -> unknown framing: read until the port times out (legacy)
+FRAMING={
+    'p':1, 'q':1, 'm':1, 'A':1, 'J':1, 'S':1, 'V':1, 'v':1,
+    'i':1, 'd':1, 'Z':1, 'D':1, 'C':1, 'c':1, 'n':1, 's':1,
+    'e':1, '?':None
+}
 
 def flush():
     s=ser.readlines()
@@ -26,9 +64,89 @@ def flush():
         rs=rs+ss.decode().replace('\r','')
     return rs
 
-def send(scmd):
+def drain():
+    '''discard unread bytes (late or unframed replies)'''
+    if ser.in_waiting:
+        ser.read(ser.in_waiting)
+
+def framing(scmd):
+    if not scmd:
+        return None
+    return FRAMING.get(scmd[0])
+
+def readreply(frame=None):
+    '''read one reply, returns as soon as the frame is complete'''
+    if frame is None:
+        return flush()
+
+    if isinstance(frame,str):
+        return ser.read_until(bytes(frame,'ascii')).decode().replace('\r','')
+
+    rs=''
+    for i in range(frame):
+        s=ser.readline()
+        if not s:   # timeout
+            break
+        rs=rs+s.decode().replace('\r','')
+    return rs
+
+def track(cur, scmd):
+    '''relay pattern after scmd was executed with pattern cur'''
+    if scmd[:1]=='p':
+        return scmd
+    if scmd[:1]=='q':
+        return 'p'+'-'*(4*NPROBE)
+    if scmd[:1]=='s':
+        if cur is None or scmd.split()[1:2]!=['0']:
+            return None
+        n=int(scmd.split()[2])
+        seg=[cur[1+k*NPROBE:1+(k+1)*NPROBE] for k in range(4)]
+        return 'p'+''.join([a[n:]+a[:n] for a in seg])
+    return cur
+
+def send(scmd, legacy=False):
+    global relays
+    drain()
     ser.write(bytes(scmd+'\n','ascii'))
-    return flush()
+    relays=track(relays, scmd)
+
+    if legacy:
+        return flush()
+
+    return readreply(framing(scmd))
+
+def segments(cmds):
+    '''split a batch into segments that can be written in one go'''
+    i=0
+    while i<len(cmds):
+        # the firmware consumes the first command while the rest queue
+        # in its receive buffer. An unframed command closes the segment.
+        j=i+1
+        queued=0
+        while j<len(cmds) and framing(cmds[j-1]) is not None:
+            queued+=len(cmds[j])+1
+            if queued>RXBUF:
+                break
+            j+=1
+        yield cmds[i:j]
+        i=j
+
+def sendbatch(cmds):
+    '''
+    pipelined exchange: write the commands in one go and return
+    the replies demultiplexed in command order
+    '''
+    global relays
+    drain()
+    rep=[]
+
+    for seg in segments(cmds):
+        ser.write(bytes(''.join([c+'\n' for c in seg]),'ascii'))
+        for c in seg:
+            relays=track(relays, c)
+            rep.append(readreply(framing(c)))
+
+    return rep
     
 # pp: plus injection probe
 # pm: minus injection probe
@@ -36,7 +154,7 @@ def send(scmd):
 # vm: minus voltage probe
 # may be zero -> none is active
 
-def probe(pm,pp,vm,vp):
+def probestr(pm,pp,vm,vp):
 
     if (pm or pp) and (pp==pm):
         raise
@@ -59,22 +177,159 @@ def probe(pm,pp,vm,vp):
     svp=''.join(svp)
     spm=''.join(spm)
     spp=''.join(spp)
-    ss='p'+svp+svm+spp+spm  
-    send('q')
-    sleep(0.5)
-    send(ss)
-    
+    return 'p'+svp+svm+spp+spm
+
+def translation(cur, ss, nmax=3):
+    '''
+    number of probes (1..nmax) the pattern cur has to be shifted up
+    to give ss, 0 when ss is not a translation of cur
+    '''
+    seg=[cur[1+k*NPROBE:1+(k+1)*NPROBE] for k in range(4)]
+    for n in range(1,nmax+1):
+        if 'X' in ''.join([a[:n] for a in seg]):
+            break   # no wrap around
+        if 'p'+''.join([a[n:]+a[:n] for a in seg])==ss:
+            return n
+    return 0
+
+def transition(cur, ss, force=False):
+    '''
+    relay commands to go from pattern cur to ss: (brk, mk)
+    brk: opens the relays that change (followed by RELAY_WAIT), or None
+    mk: list of commands closing the new relays
+    '''
+    if not force and ss==cur:
+        return None,[]
+
+    if force or cur is None:
+        return 'q',[ss]
+
+    # pure translation: move the whole pattern with the shift command
+    n=translation(cur, ss)
+    if n:
+        return None,['s 0 1']*n
+
+    keep='p'+''.join(['X' if a=='X' and b=='X' else '-' for a,b in zip(cur[1:],ss[1:])])
+
+    # only opening or only closing relays: no break needed
+    if keep==cur or keep==ss:
+        return None,[ss]
+
+    if 'X' not in keep:
+        keep='q'
+
+    return keep,[ss]
+
+def breakwait(cur, ss):
+    '''injection relays need the long break, potential relays do not'''
+    if cur is None or cur[1+2*NPROBE:]!=ss[1+2*NPROBE:]:
+        return RELAY_WAIT
+    return POT_WAIT
+
+def probe(pm,pp,vm,vp,force=False):
+    ss=probestr(pm,pp,vm,vp)
+    wt=breakwait(relays,ss)
+    brk,mk=transition(relays,ss,force)
+    if brk:
+        send(brk)
+        sleep(RELAY_WAIT if brk=='q' else wt)
+    if mk:
+        send(mk[0])
+
+def probe_inject(pm,pp,vm,vp,ival,force=False):
+    '''switch probes, set pwm and start injection in one exchange'''
+    brk,mk=transition(relays,probestr(pm,pp,vm,vp),force)
+    if brk:
+        send(brk)
+        sleep(RELAY_WAIT)
+    sendbatch(mk+['v'+str(ival),'Z'])
+    sleep(INJ_WAIT)
+
+def reading(sm, vs):
+    '''Reading from the replies of 'm' and 'S' (shunt voltage)'''
+    sm=sm.split()
+    return Reading(float(sm[0]),float(sm[1]),float(sm[2]),float(vs.split()[0]))
+
 def measure():
-    sm=send('m').split()
-    vs=send('S')  # shunt voltage
-    V=float(sm[0])
-    I=float(sm[1])
-    J=float(sm[2])
-    S=float(vs)
-    return V,I,J,S
+    '''all channels in one exchange, returns a Reading'''
+    sm,vs=sendbatch(['m','S'])
+    return reading(sm,vs)
+
+def stack(target=0.01, nmin=3, nmax=50, block=4, method='mean', reject=5.0):
+    '''
+    adaptive stacking: reads blocks of readings until the relative
+    standard error of V/I is below target or nmax readings are taken.
+    Spikes (reject sigma, 0: off) are dropped and re-acquired.
+    A block without current is a failed reading, returned at once
+    with an infinite error.
+    returns (Reading estimate, relative error, readings, spikes)
+    '''
+    buf=gestack.Buffer(nmax)
+    nread=0
+    nspike=0
+
+    while True:
+        n=min(block,nmax-buf.n)
+        rep=sendbatch(['m','S']*n)
+        for k in range(n):
+            buf.add(reading(rep[2*k],rep[2*k+1]))
+        nread+=n
+
+        if not buf.usable():
+            return Reading(*buf.estimate('mean')),float('inf'),buf.n,nspike
+
+        if reject:
+            idx=buf.spikes(reject)
+            buf.drop(idx)
+            nspike+=len(idx)
+
+        if buf.full() or nread>=2*nmax:
+            break
+        if buf.n>=nmin and buf.relerr(method)<=target:
+            break
+
+    return Reading(*buf.estimate(method)),buf.relerr(method),buf.n,nspike
+
+def settle(cmd='V', tol=0.01, atol=0.01, ncons=2, poll=None, tmax=None):
+    '''
+    poll a channel until ncons consecutive readings agree within tol
+    (relative) or atol, at most tmax (WAIT2). returns the time waited
+    '''
+    if poll is None:
+        poll=SETTLE_POLL
+    if tmax is None:
+        tmax=WAIT2
 
-def shift():
-    send('s 0 1')
+    t0=time.monotonic()
+    prev=None
+    n=0
+
+    while True:
+        x=float(send(cmd).split()[0])
+
+        if prev is not None and abs(x-prev)<=max(tol*abs(x),atol):
+            n+=1
+        else:
+            n=0
+
+        dt=time.monotonic()-t0
+        if n>=ncons or dt>=tmax:
+            break
+
+        prev=x
+        sleep(min(poll,tmax-dt))
+
+    return time.monotonic()-t0
+
+def shift(n=1):
+    sendbatch(['s 0 1']*n)
+
+def set_measure_injection(pwm):
+    '''set pwm, returns (current, injection voltage) once the converter follows'''
+    send('v'+str(pwm))
+    sleep(INJ_WAIT)
+    r=sendbatch(['A','J'])
+    return float(r[0].split()[0]),float(r[1].split()[0])
 
 def incr_injection(n=1):
     return int(send('i'*n).split()[1])
@@ -95,28 +350,58 @@ def set_naverage(navg):
 def probe_off():
     send('q')
 
+def release():
+    '''relays off and injection stopped'''
+    sendbatch(['q','D'])
+
 def inject(stat=True):
     if stat:
         send('Z')
     else:
         send('D')
 
+def discharge_fit(t0, v0, t1, v1, minvolt):
+    '''
+    RC decay v=v0*exp(-t/tau) through two samples,
+    returns (tau, time until minvolt) or (None, None)
+    '''
+    if not (v1>0 and v0>v1 and t1>t0 and minvolt>0):
+        return None,None
+    tau=(t1-t0)/log(v0/v1)
+    return tau,tau*log(v1/minvolt)
+
 def discharge(minvolt, minpwm=0, timeout=30, verbose=False):
-    set_injection(minpwm)
-    send('D')
+    global discharge_tau
+
+    sendbatch(['v'+str(minpwm),'D'])
+    t0=time.monotonic()
+    tp=t0
     vlow=measure_injection()
-    to=0
+    wait=DIS_SAMPLE
 
-    # only when the voltage more than requested (minvolt)
+    # only when the voltage more than requested (minvolt):
+    # sleep until the predicted crossing, then confirm
     while vlow > minvolt:
-        vlow=measure_injection()
-        print("discharging: %0.3fV"%(vlow))
-        sleep(1)
-        to+=1
-
-        if to>timeout:
+        dt=time.monotonic()-t0
+        if dt>timeout:
             print("discharge timeout...")
             break
+
+        sleep(max(0.0,min(wait,timeout-dt)))
+        vp=vlow
+        vlow=measure_injection()
+        t=time.monotonic()
+
+        tau,wait=discharge_fit(tp,vp,t,vlow,minvolt)
+        if tau is None:
+            wait=DIS_POLL
+        else:
+            discharge_tau=tau
+            wait=max(wait,SETTLE_POLL)
+        tp=t
+
+        if verbose:
+            print("discharging: %0.3fV"%(vlow))
     
     return ("discharged: %0.3fV"%(vlow))
 
@@ -179,6 +464,35 @@ def soft_calibrate(n=10, verbose=False):
 
 def get_devinfo():
     return send('?')
+
+def device_id():
+    '''stable identity of the attached device: first line of the info'''
+    info=get_devinfo().strip()
+    return info.splitlines()[0].strip() if info else ''
+
+def timing():
+    return {k:globals()[k] for k in TIMING}
+
+def read_timing(fnm):
+    try:
+        with open(fnm) as fl:
+            return json.load(fl)
+    except (OSError, ValueError):
+        return {}
+
+def load_timing(fnm=None):
+    '''use the timing profile of the attached device, None if there is none'''
+    prof=read_timing(fnm or TIMING_FILE).get(device_id())
+    if prof:
+        globals().update({k:prof[k] for k in prof if k in TIMING})
+    return prof
+
+def save_timing(fnm=None):
+    fnm=fnm or TIMING_FILE
+    prof=read_timing(fnm)
+    prof[device_id()]=timing()
+    with open(fnm,'w') as fl:
+        json.dump(prof,fl,indent=4)
     
 def measure_resistance():
     try:
@@ -198,7 +512,8 @@ def measure_r():
     send('q')
     return a
 
-def measureloop(pm,pp,vm,vp,avg=20,rep=0):
+def measureloop(pm,pp,vm,vp,avg=20,rep=0,target=0):
+    '''target>0: stack adaptively up to avg readings'''
     probe(pm,pp,vm,vp)
     try:
         n=0
@@ -208,23 +523,45 @@ def measureloop(pm,pp,vm,vp,avg=20,rep=0):
             if rep!=0 and n>rep:
                 break
 
-            vv=[0,0,0,0]
-            for i in range(avg):
-                v=measure()
-                vv[0]+=v[0]
-                vv[1]+=v[1]
-                vv[2]+=v[2]
-                vv[3]+=v[3]
-            print(vv[0]/avg,vv[1]/avg,vv[2]/avg,vv[3]/avg)
+            v,err,k,ns=stack(target,nmin=3 if target else avg,nmax=avg)
+            print(v[0],v[1],v[2],v[3],err,k,ns)
                 
     except:
         pass
 
-def init(sdev,speed=9600):
-    global ser
+def sleep(t):
+    '''host side wait, scaled while replaying'''
+    if timescale:
+        time.sleep(t/timescale)
+
+def scale_timing(speedup):
+    '''
+    divide the host side waits by speedup (0: no waiting), always
+    from the unscaled values, speedup=1 restores them
+    '''
+    global timescale, _unscaled, WAIT, WAIT2, INJ_OFF_WAIT
+
+    if _unscaled is None:
+        _unscaled=timing()
+
+    timescale=speedup
+
+    # waits of gectr, the others go through sleep()
+    for k in ('WAIT','WAIT2','INJ_OFF_WAIT'):
+        globals()[k]=_unscaled[k]/speedup if speedup else 0
+
+    if speedup==1:
+        _unscaled=None
+
+def init(sdev,speed=9600,record=None):
+    global ser, relays
+    relays=None
+    scale_timing(1)
     try:
         ser=serial.Serial(sdev, speed, timeout=1)
-        sleep(2) # just wait a bit
+        if record:
+            ser=getrace.Recorder(ser, record)
+        sleep(INIT_WAIT) # just wait a bit
         # display()
         READY=True
     except:
@@ -232,6 +569,21 @@ def init(sdev,speed=9600):
         
     return flush()
 
+def replay(fnm, speedup=0.0):
+    '''
+    use a recorded session as transport; host side waits are
+    scaled by speedup as well (0: no waiting at all)
+    '''
+    global ser, relays
+
+    ser=getrace.Replay(fnm, speedup)
+    relays=None
+    scale_timing(speedup)
+
+    return flush()
+
 def close():
     flush()
+    if isinstance(ser, (getrace.Recorder, getrace.Replay)):
+        ser.close()
 
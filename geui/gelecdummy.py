@@ -8,6 +8,7 @@
 #---------------------------------------------------------
 
 from time import sleep
+from collections import namedtuple
 import sys
 from random import random as rnd
 
@@ -15,7 +16,12 @@ NPROBE=16
 READY=False
 WAIT=0
 WAIT2=0
+INJ_OFF_WAIT=0
 current_offset=0.0
+PWMMAX=255
+discharge_tau=None
+
+Reading=namedtuple('Reading', 'V I J S')
 
 def plog(s):
     print(s)
@@ -23,9 +29,12 @@ def plog(s):
 def flush():
     return "ok"
 
-def send(scmd):
+def send(scmd, legacy=False):
     return scmd+' ok'
 
+def sendbatch(cmds):
+    return [send(c) for c in cmds]
+
 def inject(stat=True):
     return 'inject'
 
@@ -38,7 +47,7 @@ def discharge(minvolt, minpwm=5, verbose=False):
 # vm: minus voltage probe
 # may be zero -> none is active
 
-def probe(pm,pp,vm,vp):
+def probestr(pm,pp,vm,vp):
 
     if (pm or pp) and (pp==pm):
         raise
@@ -61,16 +70,32 @@ def probe(pm,pp,vm,vp):
     svp=''.join(svp)
     spm=''.join(spm)
     spp=''.join(spp)
-    ss='p'+svp+svm+spp+spm  
+    return 'p'+svp+svm+spp+spm
+
+def probe(pm,pp,vm,vp,force=False):
+    ss=probestr(pm,pp,vm,vp)
     send('q')
     sleep(0.1)
     send(ss)
-    
+
+def probe_inject(pm,pp,vm,vp,ival,force=False):
+    probe(pm,pp,vm,vp)
+    sendbatch(['v'+str(ival),'Z'])
+
 def measure():
-    return rnd(),rnd(),rnd(),rnd()
+    return Reading(rnd(),rnd(),10*rnd(),10*rnd())
+
+def stack(target=0.01, nmin=3, nmax=50, block=4, method='mean', reject=5.0):
+    return measure(),0.1*rnd(),nmin,0
     
-def shift():
-    send('s 0 1')
+def settle(cmd='V', tol=0.01, atol=0.01, ncons=2, poll=None, tmax=None):
+    return 0.0
+
+def shift(n=1):
+    sendbatch(['s 0 1']*n)
+
+def set_measure_injection(pwm):
+    return pwm*rnd()/PWMMAX,10*rnd()
 
 def incr_injection(n=1):
     send('i'*n)
@@ -92,6 +117,9 @@ def set_naverage(navg):
 def probe_off():
     send('q')
 
+def release():
+    sendbatch(['q','D'])
+
 def calibrate():
     send('C')
     
@@ -159,6 +187,9 @@ def display():
     send('e 0 1 GeoPhy Instrument')
     send('e 0 2 Univ. Padjadjaran ')
 
+def load_timing(fnm=None):
+    return None
+
 def init(sdev,speed=9600):
     print("!! DUMMY gelec interface library !!")
     
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Bounded acquisition log
+#
+# Lines are kept in a ring buffer with a running sequence
+# number. Readers hold a cursor and fetch only the lines
+# written since, the oldest lines are dropped when the buffer
+# is full. A file sink writes the lines from its own thread.
+#---------------------------------------------------------
+
+from time import time, strftime, localtime
+from collections import deque
+from itertools import islice
+from threading import Lock, Thread
+from queue import Queue
+
+DEBUG=10
+INFO=20
+WARN=30
+ERROR=40
+
+NAMES={DEBUG:'DEBUG', INFO:'INFO', WARN:'WARN', ERROR:'ERROR'}
+
+class FileSink:
+    '''appends log lines to a file from a writer thread'''
+
+    def __init__(_, fnm):
+        _.fl=open(fnm,'a')
+        _.q=Queue()
+        _.trd=Thread(target=_.run, daemon=True)
+        _.trd.start()
+
+    def run(_):
+        while True:
+            ln=_.q.get()
+            if ln is None:
+                break
+            _.fl.write(ln)
+            if _.q.empty():
+                _.fl.flush()
+        _.fl.close()
+
+    def put(_, t, level, s):
+        _.q.put('%s %-5s %s\n'%(strftime('%Y-%m-%d %H:%M:%S',localtime(t)),NAMES.get(level,level),s))
+
+    def close(_):
+        _.q.put(None)
+        _.trd.join()
+
+class Log:
+    def __init__(_, nmax=2000, level=INFO, echo=True):
+        _.buf=deque(maxlen=nmax)
+        _.nmax=nmax
+        _.level=level
+        _.echo=echo
+        _.seq=0
+        _.sink=None
+        _.lock=Lock()
+
+    def write(_, s, level=INFO):
+        if level<_.level:
+            return
+
+        t=time()
+        with _.lock:
+            _.buf.append((_.seq,level,s))
+            _.seq+=1
+
+        if _.sink:
+            _.sink.put(t,level,s)
+        if _.echo:
+            print(s)
+
+    def since(_, cursor=0, level=DEBUG):
+        '''lines written after cursor, returns (lines, new cursor)'''
+        with _.lock:
+            first=_.seq-len(_.buf)
+            new=list(islice(_.buf,max(0,cursor-first),None))
+            seq=_.seq
+
+        return [s for n,lv,s in new if lv>=level],seq
+
+    def text(_, level=DEBUG):
+        return '\n'.join(_.since(0,level)[0])
+
+    def clear(_):
+        '''drop the buffered lines, cursors stay valid'''
+        with _.lock:
+            _.buf.clear()
+
+    def open(_, fnm):
+        _.close()
+        _.sink=FileSink(fnm)
+
+    def close(_):
+        if _.sink:
+            _.sink.close()
+            _.sink=None
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Measurement sequence optimizer for probe configurations
+#
+# Reorders pconf['conf'] so that quadrupoles sharing a current
+# dipole are measured in a row and the potential probes move by
+# shift commands where possible. Entries keep their [cell_i, cell_j]
+# keys, so results land in the same place.
+#
+#   python3 geseq.py dipol.json [out=dipol-opt.json] [speed=9600]
+#---------------------------------------------------------
+
+import sys
+import json
+import gelec
+
+# cost model (s)
+T_RECHARGE=4.0      # discharge and current search for a new injection pair
+T_HOLD=0.5          # same injection pair, warm started search
+T_BREAK=gelec.RELAY_WAIT
+
+def cost(a, b, speed=9600):
+    '''expected switching time from entry a to entry b'''
+    t=0.0
+    byte=10.0/speed
+
+    if a is None or a[1][:2]!=b[1][:2]:
+        t+=T_RECHARGE
+    else:
+        t+=T_HOLD
+
+    # potential probes are kept between points (see custom_measurement)
+    ssa=None if a is None else gelec.probestr(0,0,a[1][2],a[1][3])
+    ssb=gelec.probestr(0,0,b[1][2],b[1][3])
+    brk,mk=gelec.transition(ssa,ssb)
+
+    if brk:
+        t+=T_BREAK+byte*(len(brk)+1)
+    for c in mk:
+        t+=byte*(len(c)+1)
+
+    return t
+
+def total(conf, speed=9600):
+    t=0.0
+    a=None
+    for b in conf:
+        t+=cost(a,b,speed)
+        a=b
+    return t
+
+def optimize(conf, speed=9600):
+    '''greedy nearest neighbour ordering, starting with the first entry'''
+    if not conf:
+        return []
+
+    rest=list(conf[1:])
+    seq=[conf[0]]
+
+    while rest:
+        a=seq[-1]
+        k=min(range(len(rest)), key=lambda i: cost(a,rest[i],speed))
+        seq.append(rest.pop(k))
+
+    return seq
+
+def report(conf, seq, speed=9600):
+    t0=total(conf,speed)
+    t1=total(seq,speed)
+    return 'sequence: %d points, switching %0.1fs -> %0.1fs (saves %0.1fs)'%(len(seq),t0,t1,t0-t1)
+
+if __name__ == "__main__":
+    speed=9600
+    out=None
+    cfgname=None
+
+    for arg in sys.argv[1:]:
+        if arg.find('out=') == 0:
+            out=arg.replace('out=','')
+        elif arg.find('speed=') == 0:
+            speed=int(arg.replace('speed=',''))
+        else:
+            cfgname=arg
+
+    if not cfgname:
+        print("arguments required: config.json [out=file] [speed=baud]")
+        exit(-1)
+
+    with open(cfgname) as fl:
+        pc=json.load(fl)
+
+    gelec.NPROBE=pc['nprobe']
+    seq=optimize(pc['conf'],speed)
+    print(report(pc['conf'],seq,speed))
+
+    if out:
+        pc['conf']=seq
+        with open(out,'w') as fl:
+            json.dump(pc,fl)
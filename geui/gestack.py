@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Stacking of instrument readings
+#
+# Readings (V, I, J, S) are kept in a preallocated array.
+# Spikes are flagged on the V/I ratio (median/MAD) so only
+# those samples are re-acquired, and the stack is reduced by
+# a plain or robust estimator.
+#---------------------------------------------------------
+
+import numpy as np
+
+MAD=1.4826      # MAD -> standard deviation (gaussian)
+
+def trimmed(d, cut=0.1):
+    n=len(d)
+    k=int(cut*n)
+    return np.sort(d,axis=0)[k:n-k].mean(axis=0)
+
+def huber(d, c=1.345, niter=10):
+    mu=np.median(d,axis=0)
+    s=MAD*np.median(np.abs(d-mu),axis=0)
+    s[s==0]=1.0
+
+    for i in range(niter):
+        r=np.abs(d-mu)/s
+        w=np.minimum(1.0,c/np.maximum(r,1e-12))
+        mu=(w*d).sum(axis=0)/w.sum(axis=0)
+
+    return mu
+
+estimators={
+    'mean': lambda d: d.mean(axis=0),
+    'median': lambda d: np.median(d,axis=0),
+    'trimmed': trimmed,
+    'huber': huber
+}
+
+class Buffer:
+    def __init__(_, nmax=50, nch=4):
+        _.data=np.empty((nmax,nch))
+        _.n=0
+
+    def add(_, r):
+        _.data[_.n]=r
+        _.n+=1
+
+    def full(_):
+        return _.n>=len(_.data)
+
+    def ratio(_):
+        d=_.data[:_.n]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return d[:,0]/d[:,1]
+
+    def usable(_):
+        '''number of samples with a finite V/I'''
+        return int(np.isfinite(_.ratio()).sum())
+
+    def spikes(_, k=5.0):
+        '''
+        indices of samples with V/I further than k sigma (MAD) from the
+        median, none when no sample has a finite V/I
+        '''
+        x=_.ratio()
+        bad=~np.isfinite(x)
+
+        if bad.all():
+            return np.nonzero(bad)[0][:0]
+
+        if _.n-bad.sum()>=3:
+            med=np.median(x[~bad])
+            dev=np.abs(x-med)
+            mad=MAD*np.median(dev[~bad])
+            if mad>0:
+                bad|=dev>k*mad
+
+        return np.nonzero(bad)[0]
+
+    def drop(_, idx):
+        keep=np.ones(_.n,dtype=bool)
+        keep[idx]=False
+        m=keep.sum()
+        _.data[:m]=_.data[:_.n][keep]
+        _.n=m
+
+    def estimate(_, method='mean'):
+        if _.n==0:
+            return np.full(_.data.shape[1],np.nan)
+        return estimators[method](_.data[:_.n])
+
+    def relerr(_, method='mean'):
+        '''relative standard error of V/I'''
+        x=_.ratio()
+        x=x[np.isfinite(x)]
+
+        if len(x)<2:
+            return float('inf')
+
+        est=estimators[method](x[:,None])[0]
+        if est==0.0:
+            return float('inf')
+
+        se=x.std(ddof=1)/np.sqrt(len(x))
+        if method=='median':
+            se*=1.2533     # efficiency of the median
+
+        return float(se/abs(est))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Multi-survey store for time-lapse monitoring
+#
+# A directory holding one raw float64 file per field (V, I, R,
+# SP, err), each a (survey, quadrupole) array appended row by
+# row, and index.json with the surveys and the quadrupole
+# table (pm, pp, vm, vp). Columns are reserved in advance and
+# the files are only rewritten when new quadrupoles exceed them.
+#
+#   python3 gestore.py store=monitor [dir=.] [pattern=data-*.json]
+#---------------------------------------------------------
+
+import os
+import sys
+import json
+import glob
+import numpy as np
+import gedata
+import gecatalog
+
+FIELDS=gedata.FIELDS
+NCOL=64         # initial quadrupole columns
+
+def geometry(quad, spacing=1.0):
+    '''geometric factor of pm pp vm vp quadrupoles (half space)'''
+    q=np.asarray(quad,dtype=float).reshape(-1,4)
+    pm,pp,vm,vp=q.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g=(1/np.abs(pp-vp)-1/np.abs(pp-vm)-1/np.abs(pm-vp)+1/np.abs(pm-vm))/spacing
+        return 2*np.pi/np.abs(g)
+
+class Store:
+    def __init__(_, dirname):
+        _.dirname=dirname
+        _.cols={}
+        os.makedirs(dirname,exist_ok=True)
+
+        try:
+            with open(_._path('index.json')) as fl:
+                idx=json.load(fl)
+        except OSError:
+            idx={'ncol':NCOL,'surveys':[],'quads':[]}
+
+        _.ncol=idx['ncol']
+        _.surveys=idx['surveys']
+        _.quads=idx['quads']
+        _.qidx={tuple(q):k for k,q in enumerate(_.quads)}
+        _._trim()
+
+    def _path(_, fnm):
+        return os.path.join(_.dirname,fnm)
+
+    def _save_index(_):
+        tmp=_._path('index.json.tmp')
+        with open(tmp,'w') as fl:
+            json.dump({'ncol':_.ncol,'surveys':_.surveys,'quads':_.quads},fl)
+        os.replace(tmp,_._path('index.json'))
+
+    def _trim(_):
+        '''drop rows appended after the last saved index (interrupted add)'''
+        size=len(_.surveys)*_.ncol*8
+        for f in FIELDS:
+            fnm=_._path(f+'.f8')
+            if os.path.exists(fnm) and os.path.getsize(fnm)>size:
+                os.truncate(fnm,size)
+
+    def _widen(_, ncol):
+        '''rewrite the field files with ncol columns'''
+        ns=len(_.surveys)
+        for f in FIELDS:
+            a=np.full((ns,ncol),np.nan)
+            if ns:
+                a[:,:_.ncol]=_.column(f,full=True)
+            a.tofile(_._path(f+'.f8'))
+        _.ncol=ncol
+        _.cols={}
+
+    def __len__(_):
+        return len(_.surveys)
+
+    def __contains__(_, fnm):
+        fnm=os.path.abspath(fnm)
+        return any([s['path']==fnm for s in _.surveys])
+
+    def add(_, fnm):
+        '''append a data file (JSON or .ged), returns its survey index'''
+        if fnm in _:
+            raise ValueError(f'{fnm}: already stored')
+
+        if fnm.endswith(gedata.EXT):
+            head,rec=gedata.load(fnm)
+        else:
+            with open(fnm) as fl:
+                jd=json.load(fl)
+            head,rec=jd,gedata.records(jd)
+
+        col=[]
+        for q in rec['quad'].tolist():
+            q=tuple(q)
+            if q not in _.qidx:
+                _.qidx[q]=len(_.quads)
+                _.quads.append(list(q))
+            col.append(_.qidx[q])
+
+        if len(_.quads)>_.ncol:
+            ncol=_.ncol
+            while ncol<len(_.quads): ncol*=2
+            _._widen(ncol)
+            _._save_index()
+
+        _._trim()
+        for f in FIELDS:
+            row=np.full(_.ncol,np.nan)
+            row[col]=rec[f]
+            with open(_._path(f+'.f8'),'ab') as fl:
+                fl.write(row.tobytes())
+
+        st=os.stat(fnm)
+        _.surveys.append({
+            'path': os.path.abspath(fnm),
+            'timestamp': gecatalog.timestamp(fnm,st.st_mtime),
+            'status': head.get('measurement_status'),
+            'name': head['conf'].get('name')
+        })
+        _.cols={}
+        _._save_index()
+        return len(_.surveys)-1
+
+    def update(_, dirname='.', pattern=gecatalog.PATTERN):
+        '''append the data files not yet stored, oldest first, returns their number'''
+        known=set([s['path'] for s in _.surveys])
+        new=[os.path.abspath(a) for a in glob.glob(os.path.join(dirname,pattern))]
+        new=[a for a in new if a not in known]
+        new.sort(key=lambda a: gecatalog.timestamp(a,os.stat(a).st_mtime))
+        n=0
+
+        for fnm in new:
+            try:
+                _.add(fnm)
+                n+=1
+            except (OSError, ValueError, KeyError) as e:
+                print(f'{fnm}: {e}')
+
+        return n
+
+    # ---- accessors ----
+
+    def column(_, field='R', full=False):
+        '''memory-mapped (survey, quadrupole) array of a field'''
+        if field=='rho':
+            return _.column('R')*geometry(_.quads)
+
+        if field not in _.cols:
+            ns=len(_.surveys)
+            if ns:
+                _.cols[field]=np.memmap(_._path(field+'.f8'),dtype='<f8',mode='r',shape=(ns,_.ncol))
+            else:
+                _.cols[field]=np.zeros((0,_.ncol))
+
+        a=_.cols[field]
+        return a if full else a[:,:len(_.quads)]
+
+    def times(_):
+        return np.array([s['timestamp'] for s in _.surveys])
+
+    def quad(_, pm, pp, vm, vp):
+        '''column of a quadrupole, None when never measured'''
+        return _.qidx.get((pm,pp,vm,vp))
+
+    def series(_, q, field='rho'):
+        '''(times, values) of quadrupole columns q over all surveys'''
+        return _.times(),_.column(field)[:,q]
+
+    def ratio(_, a, b, field='rho'):
+        '''survey b over survey a for all quadrupoles'''
+        x=_.column(field)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return x[b]/x[a]
+
+    def difference(_, a, b, field='rho'):
+        '''survey b minus survey a for all quadrupoles'''
+        x=_.column(field)
+        return x[b]-x[a]
+
+if __name__ == "__main__":
+    dirname='.'
+    store=None
+    pattern=gecatalog.PATTERN
+
+    for arg in sys.argv[1:]:
+        if arg.find('store=') == 0:
+            store=arg.replace('store=','')
+        elif arg.find('dir=') == 0:
+            dirname=arg.replace('dir=','')
+        elif arg.find('pattern=') == 0:
+            pattern=arg.replace('pattern=','')
+
+    if not store:
+        print("arguments required: store=directory [dir=data directory] [pattern=data-*.json]")
+        exit(-1)
+
+    st=Store(store)
+    n=st.update(dirname,pattern)
+    print(f'{n} surveys added, {len(st)} surveys of {len(st.quads)} quadrupoles in {store}')
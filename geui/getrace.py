@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Serial session record/replay for the IGF-02 driver
+#
+# trace file: MAGIC, start time (double), then records of
+#   <offset (double), direction (byte), length (ushort)> + bytes
+# direction 0: host -> instrument, 1: instrument -> host
+#---------------------------------------------------------
+
+import struct
+from time import time, sleep, monotonic
+
+MAGIC=b'GETRACE\x01'
+HEAD=struct.Struct('<d')
+REC=struct.Struct('<dBH')
+TX=0
+RX=1
+POLL=(b'V\n',b'A\n',b'J\n')   # polls of settle and discharge, their number may differ
+
+class Recorder:
+    '''serial port wrapper writing every exchanged byte to a trace'''
+
+    def __init__(_, ser, fnm, nflush=64):
+        _.ser=ser
+        _.fl=open(fnm,'wb')
+        _.t0=monotonic()
+        _.nflush=nflush
+        _.nrec=0
+        _.fl.write(MAGIC+HEAD.pack(time()))
+
+    def _log(_, dr, data):
+        t=monotonic()-_.t0
+        for i in range(0,len(data),0xffff):
+            chunk=data[i:i+0xffff]
+            _.fl.write(REC.pack(t,dr,len(chunk))+chunk)
+            _.nrec+=1
+        if _.nrec>=_.nflush:
+            _.fl.flush()
+            _.nrec=0
+        return data
+
+    def write(_, data):
+        _._log(TX,data)
+        return _.ser.write(data)
+
+    def read(_, n=1):
+        return _._log(RX,_.ser.read(n))
+
+    def readline(_):
+        return _._log(RX,_.ser.readline())
+
+    def read_until(_, term=b'\n'):
+        return _._log(RX,_.ser.read_until(term))
+
+    def readlines(_):
+        return [_._log(RX,s) for s in _.ser.readlines()]
+
+    @property
+    def in_waiting(_):
+        return _.ser.in_waiting
+
+    def close(_):
+        _.fl.close()
+        _.ser.close()
+
+def load(fnm):
+    '''returns (start time, [(offset, direction, bytes), ...])'''
+    with open(fnm,'rb') as fl:
+        buf=fl.read()
+
+    if buf[:len(MAGIC)]!=MAGIC:
+        raise ValueError(f'{fnm}: not a serial trace')
+
+    pos=len(MAGIC)
+    t0,=HEAD.unpack_from(buf,pos)
+    pos+=HEAD.size
+    ev=[]
+
+    while pos+REC.size<=len(buf):
+        t,dr,n=REC.unpack_from(buf,pos)
+        pos+=REC.size
+        ev.append((t,dr,buf[pos:pos+n]))
+        pos+=n
+
+    return t0,ev
+
+class Replay:
+    '''
+    serial-like transport answering from a recorded trace.
+    Each write must match the recorded write at the cursor (line by
+    line when the batching differs), and the bytes that followed it
+    become readable. Recorded polls (POLL) may be skipped, they are
+    counted in skipped, and a poll beyond the recorded ones repeats
+    the last reply to it. Any other mismatch raises ValueError.
+    speedup scales the recorded delays, speedup=0 delivers immediately.
+    '''
+
+    def __init__(_, fnm, speedup=0.0):
+        _.speedup=speedup
+        _.steps=[]
+        _.cursor=0
+        _.buf=bytearray()
+        _.pending=[]
+        _.skipped=0
+        _.last={}
+
+        t0,ev=load(fnm)
+        tx=None
+        tt=0.0
+        rx=[]
+        for t,dr,data in ev:
+            if dr==TX:
+                if tx is not None or rx:
+                    _.steps.append((tx,rx))
+                tx,tt,rx=data,t,[]
+            else:
+                rx.append((t-tt,data))
+        _.steps.append((tx,rx))
+
+        # data sent by the instrument before the first command
+        if _.steps and _.steps[0][0] is None:
+            _._deliver(0)
+
+    def _match(_, data):
+        '''step of data at the cursor, skipping recorded polls only'''
+        for k in range(_.cursor,len(_.steps)):
+            if _.steps[k][0]==data:
+                return k
+            if _.steps[k][0] not in POLL:
+                break
+        return None
+
+    def _step(_, data):
+        k=_._match(data)
+        if k is not None:
+            _.skipped+=k-_.cursor
+            _._deliver(k)
+            if data in POLL:
+                _.last[data]=_.steps[k][1]
+            return True
+
+        if data in _.last:
+            _.buf.extend(b''.join([a[1] for a in _.last[data]]))
+            return True
+
+        return False
+
+    def _deliver(_, k):
+        now=monotonic()
+        for dt,data in _.steps[k][1]:
+            if _.speedup:
+                _.pending.append((now+dt/_.speedup,data))
+            else:
+                _.buf.extend(data)
+        _.cursor=k+1
+
+    def _diverged(_, data):
+        nxt=_.steps[_.cursor][0] if _.cursor<len(_.steps) else None
+        raise ValueError(f'replay diverged: {data!r} at step {_.cursor} (recorded: {nxt!r})')
+
+    def write(_, data):
+        if _._step(data):
+            return len(data)
+
+        for ln in data.split(b'\n')[:-1]:
+            if not _._step(ln+b'\n'):
+                _._diverged(ln+b'\n')
+
+        return len(data)
+
+    def _arrive(_, wait=False):
+        while _.pending:
+            t,data=_.pending[0]
+            dt=t-monotonic()
+            if dt>0:
+                if not wait:
+                    break
+                sleep(dt)
+            _.buf.extend(data)
+            _.pending.pop(0)
+
+    def _take(_, n):
+        s=bytes(_.buf[:n])
+        del _.buf[:n]
+        return s
+
+    def _read_until(_, term):
+        _._arrive()
+        while term not in _.buf and _.pending:
+            t,data=_.pending[0]
+            sleep(max(0.0,t-monotonic()))
+            _._arrive()
+        if term in _.buf:
+            return _._take(_.buf.index(term)+len(term))
+        return _._take(len(_.buf))   # timeout
+
+    def read(_, n=1):
+        _._arrive()
+        if len(_.buf)<n:
+            _._arrive(wait=True)
+        return _._take(n)
+
+    def readline(_):
+        return _._read_until(b'\n')
+
+    def read_until(_, term=b'\n'):
+        return _._read_until(term)
+
+    def readlines(_):
+        _._arrive(wait=True)
+        return _._take(len(_.buf)).splitlines(keepends=True)
+
+    @property
+    def in_waiting(_):
+        _._arrive()
+        return len(_.buf)
+
+    def close(_):
+        pass
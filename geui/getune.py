@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#---------------------------------------------------------
+# Timing auto-tuner for the IGF-02 driver
+#
+# Measures relay, converter, potential and discharge response
+# of the attached instrument and stores the waits of gelec as
+# a timing profile keyed by the device identity (first line
+# of the device info):
+#   python3 getune.py comm=/dev/ttyUSB0 [speed=9600] [probe=1]
+#---------------------------------------------------------
+
+import sys
+from time import sleep, monotonic
+import gelec as g
+
+SAFETY=2.0      # margin over the measured response
+POLL=0.02       # polling interval while measuring
+TMAX=5.0        # longest response measured
+TOL=0.01
+
+def settle_time(cmd):
+    '''time until cmd reads stable, without the confirming polls'''
+    t=g.settle(cmd, tol=TOL, ncons=2, poll=POLL, tmax=TMAX)
+    return max(0.0, t-2*POLL)
+
+def drop_time(cmd, action, frac=0.01):
+    '''time until cmd falls below frac of its value before action'''
+    v0=abs(float(g.send(cmd).split()[0]))
+    t0=monotonic()
+    action()
+    while monotonic()-t0<TMAX:
+        if abs(float(g.send(cmd).split()[0]))<=frac*v0:
+            break
+        sleep(POLL)
+    return monotonic()-t0
+
+def margin(t, default):
+    '''measured response with margin, never above the conservative default'''
+    return min(default,max(SAFETY*t,POLL))
+
+def tune(pb=1, pwm=None, verbose=True):
+    '''
+    measure the response times on probes pb..pb+3,
+    returns the new timing profile
+    '''
+    if pwm is None:
+        pwm=g.PWMMAX//4
+
+    res={}
+    pm,pp,vm,vp=pb,pb+1,pb+2,pb+3
+
+    # converter response to a pwm step
+    g.probe_inject(pm,pp,vm,vp,pwm//2,force=True)
+    settle_time('A')
+    g.send('v'+str(pwm))
+    res['inj']=settle_time('A')
+
+    # potential response to the same step
+    g.send('v'+str(pwm//2))
+    res['pot']=settle_time('V')
+
+    # potential relays under current
+    g.probe(pm,pp,vm+1,vp+1)
+    res['potrelay']=settle_time('V')
+
+    # injection off
+    res['injoff']=drop_time('A', lambda: g.inject(False))
+    g.inject()
+    settle_time('A')
+
+    # injection relays opening
+    res['relay']=drop_time('A', lambda: g.send('q'))
+
+    # self potential after the injection
+    g.inject(False)
+    g.probe(0,0,vm,vp)
+    res['sp']=settle_time('V')
+
+    # discharge time constant
+    g.set_injection(pwm)
+    g.inject()
+    sleep(g.INJ_WAIT)
+    g.discharge(g.measure_injection()/10.0)
+    res['tau']=g.discharge_tau
+
+    g.release()
+
+    if verbose:
+        for k in res:
+            print('%s: %s'%(k,res[k]))
+
+    g.INJ_WAIT=margin(res['inj'],g.INJ_WAIT)
+    g.WAIT2=margin(max(res['pot'],res['inj']),g.WAIT2)
+    g.POT_WAIT=margin(res['potrelay'],g.POT_WAIT)
+    g.INJ_OFF_WAIT=margin(res['injoff'],g.INJ_OFF_WAIT)
+    g.RELAY_WAIT=margin(res['relay'],g.RELAY_WAIT)
+    g.WAIT=margin(res['sp'],g.WAIT)
+
+    if res['tau']:
+        g.DIS_SAMPLE=margin(res['tau']/10.0,g.DIS_SAMPLE)
+
+    return g.timing()
+
+if __name__ == "__main__":
+    comm='/dev/ttyUSB0'
+    speed=9600
+    pb=1
+
+    for arg in sys.argv:
+        if arg.find('comm=') == 0:
+            comm=arg.replace('comm=','')
+        if arg.find('speed=') == 0:
+            speed=int(arg.replace('speed=',''))
+        if arg.find('probe=') == 0:
+            pb=int(arg.replace('probe=',''))
+
+    g.init(comm,speed)
+    g.set_naverage(20)
+    print(tune(pb))
+    g.save_timing()
+    print(f'timing profile saved to {g.TIMING_FILE}')
+    g.close()
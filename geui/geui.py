@@ -4,12 +4,12 @@ import sys
 import os
 import json
 
-from PyQt5.QtCore import Qt, QRect, QTimer
+from PyQt5.QtCore import Qt, QRect, QObject, pyqtSignal
 
 from PyQt5.QtWidgets import (
         QWidget, QApplication, QScrollArea, 
         QFrame, QVBoxLayout, QHBoxLayout, QFormLayout, QGridLayout, 
-        QPushButton, QDialog, QFileDialog, QLineEdit, QPlainTextEdit,
+        QPushButton, QDialog, QFileDialog, QLineEdit, QPlainTextEdit, QComboBox,
         QMessageBox
         )
 
@@ -50,7 +50,8 @@ class logWindow(QDialog):
         super(logWindow, _).__init__(master)
         _.logtext=QPlainTextEdit()
         _.logtext.setReadOnly(True)
-        _.logtext.setPlainText(gc.logstring)
+        _.logtext.setMaximumBlockCount(gc.log.nmax)
+        _.logtext.setPlainText(gc.log.text())
         cbtn=QPushButton('&Close')
         cbtn.clicked.connect(lambda: _.close())
         lyo=QVBoxLayout()
@@ -67,19 +68,25 @@ class logBox(QWidget):
         _.logtext=QPlainTextEdit(_)
         _.logtext.setReadOnly(True)
         _.logtext.setFont(fn)
+        _.logtext.setMaximumBlockCount(gc.log.nmax)
+        _.cursor=0
         lyo=QVBoxLayout()
         lyo.addWidget(_.logtext)
         _.setGeometry(QRect(600, 400, 400, 120))
         _.setLayout(lyo)
         _.hide()
 
-    def setText(_,txt):
-        _.logtext.setPlainText(txt)
-        mm=_.logtext.verticalScrollBar().maximum()
-        _.logtext.verticalScrollBar().setValue(mm);
+    def refresh(_):
+        '''append the log lines written since the last refresh'''
+        lines,_.cursor=gc.log.since(_.cursor)
+        if lines:
+            _.logtext.appendPlainText('\n'.join(lines))
+            mm=_.logtext.verticalScrollBar().maximum()
+            _.logtext.verticalScrollBar().setValue(mm);
 
     def clear(_):
         _.logtext.clear()
+        _.cursor=0
 
 class setDialog(QDialog):
     def __init__(_,master):
@@ -96,12 +103,13 @@ class setDialog(QDialog):
                     'injection_volt_limit': float(_.einvhi.text()),
                     'injection_volt_low': float(_.einvlo.text()),
                     'injection_max_try': int(_.eintry.text()),
+                    'injection_search': _.esearch.currentText(),
                     'voltage_limit': float(_.evlim.text()),
                     'max_measurement_try': int(_.emtry.text()),
                     'filename_prefix': _.eprefix.text()
                     }
 
-            gc.devcfg=newcfg
+            gc.devcfg.update(newcfg)
         
         except Exception as e:
             print(e)
@@ -131,6 +139,9 @@ class setDialog(QDialog):
         _.einvhi=QLineEdit(f"{gc.devcfg['injection_volt_limit']}")
         _.einvlo=QLineEdit(f"{gc.devcfg['injection_volt_low']}")
         _.eintry=QLineEdit(f"{gc.devcfg['injection_max_try']}")
+        _.esearch=QComboBox()
+        _.esearch.addItems(list(gc.current_search))
+        _.esearch.setCurrentText(gc.search_method())
         _.evlim=QLineEdit(f"{gc.devcfg['voltage_limit']}")
         _.emtry=QLineEdit(f"{gc.devcfg['max_measurement_try']}")
         _.eprefix=QLineEdit(f"{gc.devcfg['filename_prefix']}")
@@ -153,6 +164,7 @@ class setDialog(QDialog):
         frm.addRow("inject volt high limit", _.einvhi)
         frm.addRow("inject volt low limit", _.einvlo)
         frm.addRow("injection try count", _.eintry)
+        frm.addRow("current search", _.esearch)
         frm.addRow("measurement volt limit", _.evlim)
         frm.addRow("max measure try", _.emtry)
         frm.addRow("filename prefix", _.eprefix)
@@ -169,6 +181,14 @@ class setDialog(QDialog):
         _.setLayout(grid)
 
 
+class eventBridge(QObject):
+    '''delivers the events of the measurement thread in the GUI thread'''
+    event=pyqtSignal(object)
+
+    def __init__(_):
+        super(eventBridge,_).__init__()
+        gc.subscribe(_.event.emit)
+
 class cmdButton(QPushButton):
     def __init__(_,txt, act=None, sty='cmdButton'):
         super(cmdButton,_).__init__(txt)
@@ -193,21 +213,77 @@ class Plotter(QFrame):
         _.datumbox={}
         _.probepos={}
         _.mapped=False
+        _.brushes=[QBrush(QColor(c), Qt.SolidPattern) for c in colorcode]
+        _.pbrush=QBrush(Qt.white, Qt.SolidPattern)
+        _.rbrush=[QBrush(c, Qt.SolidPattern) for c in (Qt.black,Qt.red,Qt.blue,Qt.green)]
+        _.reset()
+
+    def reset(_, values=True, probres=True):
+        '''forget the displayed measurement'''
+        _.probes=(0,0,0,0)
+
+        if values:
+            _.values={}     # (cell_i, cell_j) -> R
+            _.rmin=0
+            _.rmax=0
+
+        if probres:
+            _.probres={}    # (prob_i, prob_j) -> R
+
+        _.full=True     # everything to repaint
+        _.dirty=set()   # datum boxes to repaint
+        _.pdirty=set()  # probes to repaint
+        _.ldirty=False  # resistance labels to repaint
+        _.update()
+
+    def around(_, pos):
+        d=_.dia
+        return QRect(pos[0]-2,pos[1]-2,d+4,d+4)
+
+    def labelstrip(_):
+        y=_.yof+10
+        return QRect(0,y-17,_.scrimg.width(),15)
+
+    def onevent(_, ev):
+        '''keep a copy of what the measurement thread reports, schedule its repaint'''
+        if isinstance(ev, gc.Point):
+            _.values[ev.key]=ev.values[2]
+            if (ev.rmin,ev.rmax)!=(_.rmin,_.rmax):
+                _.rmin,_.rmax=ev.rmin,ev.rmax
+                _.full=True     # colour mapping changed
+            _.dirty.add(ev.key)
+            if _.datumbox.get(ev.key):
+                _.update(_.around(_.datumbox[ev.key]))
+
+        elif isinstance(ev, gc.Probe):
+            for k in set(_.probes)|set(ev):
+                _.pdirty.add(k)
+                if k in _.probepos:
+                    _.update(_.around(_.probepos[k]))
+            _.probes=tuple(ev)
+
+        elif isinstance(ev, gc.Resistance):
+            _.probres[ev.pair]=ev.values[0]
+            _.ldirty=True
+            _.update(_.labelstrip())
+
+        if _.full:
+            _.update()
 
     def colorscale(_,painter):
         x=_.cbx+30
         y=_.cby
 
+        painter.eraseRect(QRect(0,0,_.scrimg.width(),_.cby+15))
+
         for c in range(1,len(colorcode)):
-            painter.setPen(QPen(QColor(colorcode[c]), 1, Qt.SolidLine))
-            painter.setBrush(QBrush(QColor(colorcode[c]), Qt.SolidPattern))
-            painter.drawRect(x,y,3,10)
+            painter.fillRect(x,y,4,11,_.brushes[c])
             x+=3
 
         painter.setFont(QFont('Arial', 8))
         painter.setPen(Qt.magenta)
-        painter.drawText(_.cbx,_.cby+10, "%0.2f"%gc.rmin)
-        painter.drawText(x+10,_.cby+10, "%0.2f"%gc.rmax)
+        painter.drawText(_.cbx,_.cby+10, "%0.2f"%_.rmin)
+        painter.drawText(x+10,_.cby+10, "%0.2f"%_.rmax)
 
     def drawpoints(_):
 
@@ -260,7 +336,7 @@ class Plotter(QFrame):
                     py=y
                     
                     p.drawRect(px,py,d,d)
-                    pp[i,j]=[px,py,QColor(Qt.darkGray)]
+                    pp[i,j]=[px,py]
 
                     x+=xs
                     if xmax<x: xmax=x
@@ -276,61 +352,75 @@ class Plotter(QFrame):
         
         return img
 
-    def updatepoints(_):
-        p=QPainter(_.scrimg)
-        p.setPen(QPen(Qt.black, 2, Qt.SolidLine))
-        d=_.dia
-        db=_.datumbox
+    def drawprobe(_, p, k):
+        brush=_.pbrush
+        for r in range(4):
+            if _.probes[r]==k:
+                brush=_.rbrush[r]
 
-        p.eraseRect(QRect(0,0,_.scrimg.width(),_.scrimg.height())) 
-        p.setPen(QPen(Qt.black, 2, Qt.SolidLine))
-        p.setBrush(QBrush(Qt.white,Qt.SolidPattern))
+        p.setBrush(brush)
+        p.drawEllipse(_.probepos[k][0],_.probepos[k][1],_.dia,_.dia)
 
-        for i in range(1,_.master.pconf['nprobe']+1):
-            p.drawEllipse(_.probepos[i][0],_.probepos[i][1],d,d)
-
-        if gc.pm>0:
-            prb=_.probepos
-            p.setBrush(QBrush(Qt.black,Qt.SolidPattern))
-            p.drawEllipse(prb[gc.pm][0],prb[gc.pm][1],d,d)
-            p.setBrush(QBrush(Qt.red,Qt.SolidPattern))
-            p.drawEllipse(prb[gc.pp][0],prb[gc.pp][1],d,d)
-            p.setBrush(QBrush(Qt.blue,Qt.SolidPattern))
-            p.drawEllipse(prb[gc.vm][0],prb[gc.vm][1],d,d)
-            p.setBrush(QBrush(Qt.green,Qt.SolidPattern))
-            p.drawEllipse(prb[gc.vp][0],prb[gc.vp][1],d,d)
-
-        # FIXME
-        for rr in gc.resarr:
-            if rr in db:
-                cid=gc.resmap(rr, colorcode)
-                db[rr][2]=QColor(colorcode[cid])
-
-        for g in db:
-            p.setBrush(QBrush(db[g][2], Qt.SolidPattern))
-            p.drawRect(db[g][0], db[g][1], d,d)
+    def drawbox(_, p, rr):
+        cid=gc.colorindex(_.values.get(rr), len(colorcode), _.rmin, _.rmax)
+        p.setBrush(_.brushes[cid])
+        p.drawRect(_.datumbox[rr][0], _.datumbox[rr][1], _.dia, _.dia)
 
+    def drawlabels(_, p):
+        p.eraseRect(_.labelstrip())
         p.setFont(QFont('Arial', 8))
         p.setPen(Qt.magenta)
-        
+
         for g in range(1,_.master.pconf['nprobe']):
-            if gc.probres[g,g+1]:
-                p.drawText(_.probepos[g][0]+15, _.probepos[g][1]-5, '%0.2f'%gc.probres[g,g+1][0])
+            if (g,g+1) in _.probres:
+                p.drawText(_.probepos[g][0]+15, _.probepos[g][1]-5, '%0.2f'%_.probres[g,g+1])
+
+    def updatepoints(_):
+        '''
+        repaint the boxes and probes changed since the last frame,
+        everything when the colour mapping changed
+        '''
+        p=QPainter(_.scrimg)
+        p.setPen(QPen(Qt.black, 2, Qt.SolidLine))
+
+        if _.full:
+            probes=_.probepos
+            boxes=_.datumbox
+        else:
+            probes=[k for k in _.pdirty if k in _.probepos]
+            boxes=[k for k in _.dirty if k in _.datumbox]
+
+        for k in probes:
+            _.drawprobe(p,k)
+
+        for rr in boxes:
+            if _.datumbox[rr]:
+                _.drawbox(p,rr)
+
+        if _.full or _.ldirty:
+            _.drawlabels(p)
+
+        if _.full:
+            _.colorscale(p)
 
-        _.colorscale(p)
         p.end()
+
+        _.full=False
+        _.dirty.clear()
+        _.pdirty.clear()
+        _.ldirty=False
     
     def paintEvent(_, event):
         pc=QPainter(_)
 
         if _.master.pconf:
-            if _.mapped:
-                _.updatepoints()
-            else:
+            if not _.mapped:
                 _.scrimg=_.drawpoints()
                 _.resize(_.scrimg.width(), _.scrimg.height())
-            
-            pc.drawPixmap(0,0,_.scrimg)
+                _.full=True
+
+            _.updatepoints()
+            pc.drawPixmap(event.rect(), _.scrimg, event.rect())
         else:
             pc.setPen(Qt.yellow)
             pc.setFont(QFont('Arial', 20))
@@ -372,8 +462,8 @@ class GEWin(QWidget):
         _.canvas=Plotter(_)
         _.resarr=None
         _.proarr=None
-        _.uptimer=QTimer()
-        _.uptimer.timeout.connect(_.update)
+        _.bridge=eventBridge()
+        _.bridge.event.connect(_.onevent)
         _.createGadgets()
         _.logwin=logBox(_)
         _.show()
@@ -393,16 +483,19 @@ class GEWin(QWidget):
         _.res.setEnabled(doit)
         _.sett.setEnabled(doit)
 
-    def update(_):
-        _.canvas.repaint()
-        _.logwin.setText(gc.logstring)
-        
-        if not gc.msrev.is_set():
-            _.uptimer.stop()
+    def onevent(_, ev):
+        if isinstance(ev, gc.Logged):
+            _.logwin.refresh()
+
+        elif isinstance(ev, gc.Finished):
+            _.logwin.refresh()
             _.cfg.setText('Probe Conf')
             _.grayButton(False)
             _.logwin.hide()
 
+        else:
+            _.canvas.onevent(ev)
+
     def probeconf(_): # this button has 2 functions..: cancel
         if gc.msrev.is_set():
             gc.msrev.clear()
@@ -426,22 +519,33 @@ class GEWin(QWidget):
 
             _.pconf=pc
             gc.set_conf(_.pconf)
+            _.canvas.reset()
+            _.canvas.mapped=False
             _.canvas.repaint()
 
     def doacq(_):
         if(_.pconf==None): 
             _.probeconf()
+            if(_.pconf==None): return
         
+        resume=False
+        npend=gc.journal_pending()
+        if npend:
+            confirm=QMessageBox.question(_, 'Resume', 
+                    f'Interrupted measurement found ({npend} points).\nResume ?', 
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            resume=(confirm==QMessageBox.Yes)
+
         _.cfg.setText('&CANCEL')
         _.grayButton(True)
 
         gc.msrev.set()
         _.logwin.show()  # FIXME
         _.logwin.clear()
+        _.canvas.reset(probres=False)
 
-        trid=Thread(target=gc.custom_measurement)
+        trid=Thread(target=gc.custom_measurement, args=(resume,))
         trid.start()
-        _.uptimer.start(100)
 
 
     def dores(_):
@@ -455,11 +559,11 @@ class GEWin(QWidget):
         _.logwin.show()  # FIXME
         _.logwin.clear()
 
+        _.canvas.reset(values=False)
+
         trid=Thread(target=gc.measure_resistances)
         trid.start()
 
-        _.uptimer.start(100)
-
     def doset(_):
         setDialog(_)
 
@@ -469,6 +573,7 @@ class GEWin(QWidget):
         
         if confirm == QMessageBox.Yes:
             gc.msrev.clear()
+            gc.log.close()
             _.close()
             ev.accept()
         else: